@@ -1,26 +1,15 @@
 import os
 import uuid
-import zipfile
-import tempfile
-import pandas as pd
-import segno
-from flask import Flask, render_template, request, send_file, jsonify, url_for, redirect, session
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-import math
-import shutil
+from flask import Flask, Response, render_template, request, send_file, jsonify, url_for, session
 from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
+from datetime import timedelta
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from apscheduler.schedulers.background import BackgroundScheduler
 import logging
 from dotenv import load_dotenv
-from PIL import Image
-import io
 import base64
 import time
-import json
 
 # Load environment variables
 load_dotenv()
@@ -42,12 +31,34 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 app.config['ALLOWED_EXTENSIONS'] = {'xlsx', 'xls', 'csv', 'jpg', 'jpeg', 'png'}
 app.config['SESSION_LIFETIME'] = timedelta(hours=1)
+app.config['QR_WORKERS'] = int(os.environ.get('QR_WORKERS', 0)) or None  # None = one per CPU
+app.config['QR_CHUNK_SIZE'] = int(os.environ.get('QR_CHUNK_SIZE', 250))
+app.config['QR_SHARED_MASKS'] = os.environ.get('QR_SHARED_MASKS', 'false').lower() == 'true'
+app.config['QR_IN_MEMORY'] = os.environ.get('QR_IN_MEMORY', 'true').lower() == 'true'
+app.config['ASYNC_JOBS'] = os.environ.get('ASYNC_JOBS', 'true').lower() == 'true'
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['STREAM_ZIP'] = os.environ.get('STREAM_ZIP', 'true').lower() == 'true'
+# Larger jobs build their ZIP in the background, streaming encodes every download again
+app.config['STREAM_ZIP_MAX_ROWS'] = int(os.environ.get('STREAM_ZIP_MAX_ROWS', 5000))
+app.config['QR_CACHE_ITEMS'] = int(os.environ.get('QR_CACHE_ITEMS', 10000))
+app.config['QR_CACHE_MEMORY_MB'] = int(os.environ.get('QR_CACHE_MEMORY_MB', 32))
+app.config['QR_CACHE_DIR'] = os.environ.get('QR_CACHE_DIR')  # Disk tier is off unless set
+app.config['QR_CACHE_DISK_MB'] = int(os.environ.get('QR_CACHE_DISK_MB', 256))
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+# Pool rendering single codes for the async endpoint in asgi.py
+app.config['PREVIEW_EXECUTOR'] = os.environ.get('PREVIEW_EXECUTOR', 'process')  # or 'thread'
+app.config['PREVIEW_WORKERS'] = int(os.environ.get('PREVIEW_WORKERS', 0)) or None  # None = one per CPU
+# Single codes are saved for download by a background thread, or only when
+# downloaded with 'lazy' (needs one server process, or sticky sessions)
+app.config['PREVIEW_PERSISTENCE'] = os.environ.get('PREVIEW_PERSISTENCE', 'background')
+app.config['PREVIEW_MEMORY_MB'] = int(os.environ.get('PREVIEW_MEMORY_MB', 64))
 
 # Rate limiting to prevent abuse
+DEFAULT_LIMITS = ["200 per day", "50 per hour"]
 limiter = Limiter(
     get_remote_address,
     app=app,
-    default_limits=["200 per day", "50 per hour"],
+    default_limits=DEFAULT_LIMITS,
     storage_uri="memory://",
 )
 
@@ -55,8 +66,31 @@ limiter = Limiter(
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Import utility functions
-from utils.qr_generator import generate_qr_codes, create_qr_pdf, create_styled_qr
-from utils.file_utils import read_file_data, allowed_file, cleanup_old_files
+from utils.qr_generator import fit_qr_size, BULK_STYLES, IMAGE_FORMATS, PAGE_LAYOUTS, MIN_QR_SIZE
+from utils.single_qr import render_single_qr, SINGLE_TYPES, SINGLE_DOWNLOADS
+from utils.file_utils import cleanup_old_files
+from utils.pipeline import run_bulk_generation, stream_zip_download, SVG_SHEET
+from utils.jobs import JobManager
+from utils.qr_cache import render_cache
+from utils.previews import preview_store
+from utils.metrics import metrics
+
+# Rendered QR codes are cached across requests
+render_cache.configure(
+    max_items=app.config['QR_CACHE_ITEMS'],
+    max_bytes=app.config['QR_CACHE_MEMORY_MB'] * 1024 * 1024,
+    disk_dir=app.config['QR_CACHE_DIR'],
+    max_disk_bytes=app.config['QR_CACHE_DISK_MB'] * 1024 * 1024
+)
+
+# Rendered single codes wait in memory until they are saved
+preview_store.configure(
+    mode=app.config['PREVIEW_PERSISTENCE'],
+    max_bytes=app.config['PREVIEW_MEMORY_MB'] * 1024 * 1024
+)
+
+# Background executor for bulk generation jobs
+job_manager = JobManager(max_workers=app.config['JOB_WORKERS'])
 
 # Setup scheduler for cleanup tasks
 scheduler = BackgroundScheduler()
@@ -75,8 +109,15 @@ def index():
 @app.route('/generate', methods=['POST'])
 def generate():
     """Handle QR code generation requests"""
+    start_time = time.perf_counter()
+    generation_type = request.form.get('generation_type')
+    # Keep metric labels to a known set
+    metric_type = generation_type if generation_type in ('excel', 'url', 'vcard', 'image') else 'unknown'
+    metrics.inc('qr_requests_total', type=metric_type)
+    if 'user_id' in session:
+        metrics.mark_active(session['user_id'])
+    
     try:
-        generation_type = request.form.get('generation_type')
         
         if generation_type == 'excel':
             # Check if file was uploaded
@@ -122,6 +163,10 @@ def generate():
     except Exception as e:
         logger.error(f"Error in generate route: {str(e)}")
         return jsonify({'error': f'An error occurred: {str(e)}'})
+    
+    finally:
+        metrics.observe('qr_stage_seconds', time.perf_counter() - start_time,
+                        stage='request', type=metric_type)
 
 
 def handle_excel_generation(request_form, file):
@@ -147,10 +192,32 @@ def handle_excel_generation(request_form, file):
         include_page_numbers = request_form.get('include_page_numbers') == 'true'
         error_level = request_form.get('error_level', 'l')
         download_type = request_form.get('download_type', 'pdf')
+        pdf_render = request_form.get('pdf_render', 'raster')
+        qr_style = request_form.get('qr_style', 'standard')
+        image_format = request_form.get('image_format', 'png')
+        svg_sheet = request_form.get('svg_sheet') == 'true'
+        page_layout = request_form.get('page_layout', 'a4')
+        auto_fit = request_form.get('auto_fit') == 'true'
         
         # Validate inputs
-        if qr_size < 50:
-            qr_size = 50  # Minimum size for reliable scanning
+        if qr_size < MIN_QR_SIZE:
+            qr_size = MIN_QR_SIZE  # Minimum size for reliable scanning
+        
+        if page_layout not in PAGE_LAYOUTS:
+            return {'error': f'Unknown page layout: {page_layout}'}
+        
+        if auto_fit:
+            # qr_size is the smallest size wanted, grown to fill the pages
+            qr_size = fit_qr_size(qr_size, page_margin, qr_margin, include_text, page_layout)
+        
+        if qr_style not in BULK_STYLES:
+            return {'error': f'Style "{qr_style}" is not available for bulk generation'}
+        
+        if image_format not in IMAGE_FORMATS:
+            return {'error': f'Unsupported image format: {image_format}'}
+        
+        if (image_format != 'png' or svg_sheet) and qr_style != 'standard':
+            return {'error': 'SVG and EPS output is only available for the standard style'}
         
         # Create unique session directory
         session_id = session.get('user_id', str(uuid.uuid4()))
@@ -160,50 +227,39 @@ def handle_excel_generation(request_form, file):
         
         # Save uploaded file
         file_path = os.path.join(session_dir, secure_filename(file.filename))
-        file.save(file_path)
+        with metrics.timer('qr_stage_seconds', stage='upload_save', type='excel'):
+            file.save(file_path)
         
-        # Read data from file
-        data = read_file_data(file_path, column_index, max_rows)
-        
-        if not data:
-            return {'error': 'No valid data found in the specified column'}
-        
-        # Generate QR codes
-        qr_files = generate_qr_codes(data, session_dir, qr_size, error_level)
-        
-        # Create output files based on download type
-        pdf_stats = None
-        
-        if download_type in ['pdf', 'both']:
-            pdf_path = os.path.join(session_dir, 'qr_codes.pdf')
-            pdf_stats = create_qr_pdf(
-                qr_files, pdf_path, qr_size, page_margin, qr_margin,
-                include_text, include_page_numbers
-            )
-        
-        if download_type in ['zip', 'both']:
-            # Create zip file with individual QR codes
-            zip_path = os.path.join(session_dir, 'qr_codes.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for i, (qr_file, code) in enumerate(qr_files):
-                    # Use the code value as filename (sanitized)
-                    safe_name = "".join([c if c.isalnum() else "_" for c in code])
-                    safe_name = safe_name[:50]  # Limit filename length
-                    zipf.write(qr_file, f"{safe_name}.png")
-        
-        # Prepare response
-        response = {
-            'success': True,
-            'message': f'Successfully generated {len(qr_files)} QR codes',
-            'stats': pdf_stats if pdf_stats else {'total_qr_codes': len(qr_files)}
+        options = {
+            'column_index': column_index,
+            'max_rows': max_rows,
+            'qr_size': qr_size,
+            'page_margin': page_margin,
+            'qr_margin': qr_margin,
+            'include_text': include_text,
+            'include_page_numbers': include_page_numbers,
+            'error_level': error_level,
+            'download_type': download_type,
+            'pdf_render': pdf_render,
+            'style': qr_style,
+            'image_format': image_format,
+            'svg_sheet': svg_sheet,
+            'page_layout': page_layout,
+            'workers': app.config['QR_WORKERS'],
+            'chunk_size': app.config['QR_CHUNK_SIZE'],
+            'shared_masks': app.config['QR_SHARED_MASKS'],
+            'in_memory': app.config['QR_IN_MEMORY'],
+            'stream_zip': app.config['STREAM_ZIP'],
+            'stream_zip_max_rows': app.config['STREAM_ZIP_MAX_ROWS']
         }
         
         # Add download URLs based on download type
+        download_urls = {}
         download_links = []
         
         if download_type in ['pdf', 'both']:
             pdf_url = url_for('download_file', session_id=session_id, file_type='pdf')
-            response['pdf_url'] = pdf_url
+            download_urls['pdf_url'] = pdf_url
             download_links.append({
                 'url': pdf_url,
                 'label': 'Download PDF'
@@ -211,188 +267,107 @@ def handle_excel_generation(request_form, file):
         
         if download_type in ['zip', 'both']:
             zip_url = url_for('download_file', session_id=session_id, file_type='zip')
-            response['zip_url'] = zip_url
+            download_urls['zip_url'] = zip_url
             download_links.append({
                 'url': zip_url,
                 'label': 'Download ZIP'
             })
         
-        # Add download links for the frontend
-        response['download_links'] = download_links
+        if svg_sheet:
+            sheet_url = url_for('download_file', session_id=session_id, file_type='svg')
+            download_urls['svg_url'] = sheet_url
+            download_links.append({
+                'url': sheet_url,
+                'label': 'Download SVG Sheet'
+            })
         
-        return response
+        def run_job(progress=None):
+            result = run_bulk_generation(file_path, session_dir, options, progress)
+            total = result['stats']['total_qr_codes']
+            
+            if 'zip_manifest' not in result:
+                message = f'Successfully generated {total} QR codes'
+            elif download_type == 'zip' and not svg_sheet:
+                # Nothing was encoded yet, only the rows were counted
+                message = f'{total} QR codes ready, they are encoded as the ZIP downloads'
+            else:
+                message = f'Successfully generated {total} QR codes, the ZIP is built as it downloads'
+            
+            # Prepare response
+            response = {
+                'success': True,
+                'message': message,
+                'stats': result['stats']
+            }
+            response.update(download_urls)
+            
+            # Add download links for the frontend
+            response['download_links'] = download_links
+            return response
+        
+        if not app.config['ASYNC_JOBS']:
+            return run_job()
+        
+        # Run the generation in the background, the client polls the status URL
+        job_id = job_manager.submit(session_dir, run_job)
+        return {
+            'success': True,
+            'message': 'QR code generation started',
+            'job_id': job_id,
+            'status_url': url_for('job_status', session_id=session_id, job_id=job_id)
+        }
         
     except Exception as e:
         logger.error(f"Error generating QR codes: {str(e)}")
         return {'error': f'Error generating QR codes: {str(e)}'}
 
 def handle_url_generation(form_data):
-    url = form_data.get('url', '').strip()
-    if not url:
-        return {'error': 'URL is required'}
-    
-    # Validate URL format
-    if not url.startswith(('http://', 'https://')):
-        url = 'https://' + url
-    
-    qr_size = int(form_data.get('qr_size', 300))
-    error_level = form_data.get('error_level', 'm')
-    qr_style = form_data.get('qr_style', 'standard')
-    
-    # Create unique session directory
-    session_id = session.get('user_id', str(uuid.uuid4()))
-    session_dir = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
-    os.makedirs(session_dir, exist_ok=True)
-    
-    # Generate QR code
-    qr_file = os.path.join(session_dir, 'url_qr.png')
-    
-    # Create styled QR code
-    create_styled_qr(url, qr_file, qr_size, error_level, qr_style)
-    
-    # Create a preview image for display
-    with open(qr_file, 'rb') as f:
-        img_data = base64.b64encode(f.read()).decode('utf-8')
-    
-    return {
-        'success': True,
-        'message': 'URL QR code generated successfully',
-        'download_url': url_for('download_file', session_id=session_id, file_type='url_qr'),
-        'preview': f'data:image/png;base64,{img_data}'
-    }
+    return handle_single_generation('url', form_data)
 
-def handle_image_generation(file, form_data):
-    qr_data = form_data.get('qr_data', '').strip()
-    if not qr_data:
-        return {'error': 'QR code data is required'}
-    
-    qr_size = int(form_data.get('qr_size', 300))
-    error_level = form_data.get('error_level', 'h')  # Use high error correction for image QR
-    
-    # Create unique session directory
-    session_id = session.get('user_id', str(uuid.uuid4()))
-    session_dir = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
-    os.makedirs(session_dir, exist_ok=True)
-    
-    # Save uploaded image
-    img_path = os.path.join(session_dir, secure_filename(file.filename))
-    file.save(img_path)
-    
-    # Generate QR code with embedded image
-    qr_file = os.path.join(session_dir, 'image_qr.png')
-    
-    # Create QR code with image overlay
-    qr = segno.make(qr_data, error=error_level)
-    
-    # Open and resize the image
-    img = Image.open(img_path)
-    img = img.resize((qr_size // 3, qr_size // 3))
-    
-    # Create a new image with the QR code
-    scale = max(1, int(qr_size / 25))
-    qr_img = qr.to_pil(scale=scale, border=4)
-    
-    # Calculate position to place the image in the center
-    position = ((qr_img.width - img.width) // 2, (qr_img.height - img.height) // 2)
-    
-    # Paste the image onto the QR code
-    qr_img.paste(img, position)
-    qr_img.save(qr_file)
-    
-    # Create a preview image for display
-    with open(qr_file, 'rb') as f:
-        img_data = base64.b64encode(f.read()).decode('utf-8')
-    
-    return {
-        'success': True,
-        'message': 'Image QR code generated successfully',
-        'download_url': url_for('download_file', session_id=session_id, file_type='image_qr'),
-        'preview': f'data:image/png;base64,{img_data}'
-    }
+def handle_image_generation(form_data, file):
+    return handle_single_generation('image', form_data, file.read())
 
 def handle_vcard_generation(form_data):
-    # Get vCard data
-    name = form_data.get('name', '').strip()
-    email = form_data.get('email', '').strip()
-    phone = form_data.get('phone', '').strip()
-    company = form_data.get('company', '').strip()
-    title = form_data.get('title', '').strip()
-    website = form_data.get('website', '').strip()
-    address = form_data.get('address', '').strip()
-    
-    if not (name or email or phone):
-        return {'error': 'At least name, email, or phone is required'}
-    
-    # Create vCard format
-    vcard = [
-        "BEGIN:VCARD",
-        "VERSION:3.0"
-    ]
-    
-    if name:
-        vcard.append(f"FN:{name}")
-        # Split name into parts if possible
-        name_parts = name.split()
-        if len(name_parts) > 1:
-            vcard.append(f"N:{name_parts[-1]};{' '.join(name_parts[:-1])}")
-        else:
-            vcard.append(f"N:{name}")
-    
-    if email:
-        vcard.append(f"EMAIL:{email}")
-    
-    if phone:
-        vcard.append(f"TEL:{phone}")
-    
-    if company:
-        vcard.append(f"ORG:{company}")
-    
-    if title:
-        vcard.append(f"TITLE:{title}")
-    
-    if website:
-        if not website.startswith(('http://', 'https://')):
-            website = 'https://' + website
-        vcard.append(f"URL:{website}")
-    
-    if address:
-        vcard.append(f"ADR:;;{address}")
-    
-    vcard.append("END:VCARD")
-    vcard_data = "\n".join(vcard)
-    
-    # Generate QR code
-    qr_size = int(form_data.get('qr_size', 300))
-    error_level = form_data.get('error_level', 'm')
-    
-    # Create unique session directory
+    return handle_single_generation('vcard', form_data)
+
+def handle_single_generation(generation_type, form_data, image=None):
+    """Render a single URL, vCard or image code for preview and download"""
+    with metrics.timer('qr_stage_seconds', stage='encode', type=generation_type):
+        try:
+            png = render_single_qr(generation_type, form_data.to_dict(), image)
+        except ValueError as e:
+            return {'error': str(e)}
+    metrics.inc('qr_codes_generated_total', type=generation_type)
+    
+    # The file in the session directory is written later, from the same bytes
     session_id = session.get('user_id', str(uuid.uuid4()))
-    session_dir = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
-    os.makedirs(session_dir, exist_ok=True)
-    
-    # Generate QR code
-    qr_file = os.path.join(session_dir, 'vcard_qr.png')
-    
-    # Create QR code
-    qr = segno.make(vcard_data, error=error_level)
-    scale = max(1, int(qr_size / 25))
-    qr.save(qr_file, scale=scale, border=4)
+    file_name, message = SINGLE_TYPES[generation_type]
+    preview_store.save(os.path.join(app.config['UPLOAD_FOLDER'], session_id, file_name), png)
     
     # Create a preview image for display
-    with open(qr_file, 'rb') as f:
-        img_data = base64.b64encode(f.read()).decode('utf-8')
+    with metrics.timer('qr_stage_seconds', stage='preview', type=generation_type):
+        img_data = base64.b64encode(png).decode('utf-8')
     
     return {
         'success': True,
-        'message': 'vCard QR code generated successfully',
-        'download_url': url_for('download_file', session_id=session_id, file_type='vcard_qr'),
+        'message': message,
+        'download_url': url_for('download_file', session_id=session_id, file_type=f'{generation_type}_qr'),
         'preview': f'data:image/png;base64,{img_data}'
     }
 
 @app.route('/download/<session_id>/<file_type>')
 def download_file(session_id, file_type):
+    metric_type = file_type if file_type in ('pdf', 'zip', 'url_qr', 'image_qr', 'vcard_qr') else 'invalid'
+    with metrics.timer('qr_stage_seconds', stage='download', type=metric_type):
+        return _download_file(session_id, file_type)
+
+def _download_file(session_id, file_type):
     session_dir = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
     
+    if file_type in SINGLE_DOWNLOADS:
+        # Save the single code now if it is still only in memory
+        preview_store.persist(os.path.join(session_dir, SINGLE_DOWNLOADS[file_type]))
+    
     if not os.path.exists(session_dir):
         logger.warning(f"Download attempt for non-existent session: {session_id}")
         return "Files not found or expired", 404
@@ -404,33 +379,77 @@ def download_file(session_id, file_type):
         file_path = os.path.join(session_dir, 'qr_codes.pdf')
         return send_file(file_path, as_attachment=True, download_name='qr_codes.pdf')
     elif file_type == 'zip':
+        # Build the archive while it is sent if the job left a manifest
+        zip_stream = stream_zip_download(session_dir, app.config['QR_WORKERS'], app.config['QR_CHUNK_SIZE'])
+        if zip_stream is not None:
+            return Response(zip_stream, mimetype='application/zip', headers={
+                'Content-Disposition': 'attachment; filename=qr_codes.zip'
+            })
+        
         file_path = os.path.join(session_dir, 'qr_codes.zip')
         return send_file(file_path, as_attachment=True, download_name='qr_codes.zip')
-    elif file_type == 'url_qr':
-        file_path = os.path.join(session_dir, 'url_qr.png')
-        return send_file(file_path, as_attachment=True, download_name='url_qr.png')
-    elif file_type == 'image_qr':
-        file_path = os.path.join(session_dir, 'image_qr.png')
-        return send_file(file_path, as_attachment=True, download_name='image_qr.png')
-    elif file_type == 'vcard_qr':
-        file_path = os.path.join(session_dir, 'vcard_qr.png')
-        return send_file(file_path, as_attachment=True, download_name='vcard_qr.png')
+    elif file_type == 'svg':
+        file_path = os.path.join(session_dir, SVG_SHEET)
+        return send_file(file_path, as_attachment=True, download_name=SVG_SHEET)
+    elif file_type in SINGLE_DOWNLOADS:
+        file_path = os.path.join(session_dir, SINGLE_DOWNLOADS[file_type])
+        return send_file(file_path, as_attachment=True, download_name=SINGLE_DOWNLOADS[file_type])
     else:
         return "Invalid file type", 400
 
+@app.route('/jobs/<session_id>/<job_id>')
+@limiter.exempt
+def job_status(session_id, job_id):
+    """Report the progress of a background generation job"""
+    session_dir = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
+    job = job_manager.get(session_dir, job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    
+    return jsonify(job)
+
+def is_admin_request():
+    """Check the admin key, sent as X-Admin-Key or as a bearer token"""
+    admin_key = os.environ.get('ADMIN_API_KEY')
+    if not admin_key:
+        # Without a configured key the admin endpoints stay closed
+        return False
+    bearer = request.headers.get('Authorization', '')
+    if bearer.startswith('Bearer ') and bearer[len('Bearer '):] == admin_key:
+        return True
+    return request.headers.get('X-Admin-Key') == admin_key
+
 @app.route('/api/stats')
 def api_stats():
     """API endpoint for usage statistics (for admin dashboard)"""
-    if request.headers.get('X-Admin-Key') != os.environ.get('ADMIN_API_KEY'):
+    if not is_admin_request():
         return jsonify({'error': 'Unauthorized'}), 403
     
-    # This would be implemented with a proper database in production
+    # Statistics are kept in memory by each server process
+    requests_by_type = metrics.counter_values('qr_requests_total', 'type')
     return jsonify({
-        'total_generations': 0,
-        'active_users': 0,
-        'popular_formats': {}
+        'total_generations': sum(requests_by_type.values()),
+        'active_users': metrics.active_sessions(app.config['SESSION_LIFETIME'].total_seconds()),
+        'popular_formats': requests_by_type,
+        'qr_codes_generated': metrics.counter_values('qr_codes_generated_total', 'type'),
+        'qr_symbols_encoded': metrics.counter_values('qr_symbols_encoded_total', 'symbol'),
+        'timings': metrics.snapshot(),
+        'render_cache': render_cache.stats()
     })
 
+@app.route('/metrics')
+@limiter.exempt
+def prometheus_metrics():
+    """Expose the metrics in the Prometheus text format"""
+    if not is_admin_request():
+        return "Unauthorized", 403
+    
+    cache_stats = render_cache.stats()
+    gauges = {f"qr_render_cache_{name}": value for name, value in cache_stats.items()}
+    gauges['qr_active_users'] = metrics.active_sessions(app.config['SESSION_LIFETIME'].total_seconds())
+    return Response(metrics.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
 @app.route('/sitemap.xml')
 def sitemap():
     """Generate a sitemap for SEO"""
@@ -0,0 +1,240 @@
+"""
+ASGI entry point that answers single-code requests without blocking
+
+POST /generate requests for URL, vCard and image codes are handled on
+the event loop: the code is rendered in a pool of worker processes (or
+threads, see PREVIEW_EXECUTOR and PREVIEW_WORKERS) and kept in memory
+for download, so a server process keeps thousands of these requests in
+flight. They get the same JSON, session cookie and rate limits as with
+the Flask app. Everything else (bulk jobs, downloads, pages) is passed
+to the Flask app, which runs in a thread pool. Run as a single process,
+PREVIEW_PERSISTENCE=lazy only writes the codes that are downloaded.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+benchmarks/load_preview.py load-tests either server.
+"""
+import os
+import io
+import json
+import time
+import uuid
+import base64
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from limits import parse
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_options_header, parse_cookie, dump_cookie
+from app import app as flask_app, limiter, DEFAULT_LIMITS
+from utils.single_qr import render_single_qr, render_single_qr_counted, SINGLE_TYPES
+from utils.previews import preview_store
+from utils.qr_cache import render_cache
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Request bodies larger than this are parsed in a thread, off the event loop
+INLINE_PARSE_BYTES = 64 * 1024
+
+def _parse_form(content_type, body):
+    """Parse a urlencoded or multipart body into (form, files)"""
+    mimetype, options = parse_options_header(content_type)
+    _, form, files = FormDataParser().parse(io.BytesIO(body), mimetype, len(body), options)
+    return form, files
+
+def _replay(body, receive):
+    """A receive callable that hands an already read body to the next app"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+
+    return replay
+
+async def _send(send, status, body, content_type, cookie=None):
+    headers = [(b'content-type', content_type), (b'content-length', str(len(body)).encode('ascii'))]
+    if cookie:
+        headers.append((b'set-cookie', cookie.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+class PreviewApp:
+    """
+    ASGI app rendering single codes asynchronously in front of a WSGI app
+
+    Only POST /generate requests for one of SINGLE_TYPES are handled here;
+    every other request goes to the WSGI app unchanged.
+    """
+
+    def __init__(self, wsgi_app, executor='process', workers=None):
+        self.wsgi = WSGIMiddleware(wsgi_app)
+        self.executor_kind = executor
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self.rate_limits = [parse(limit) for limit in DEFAULT_LIMITS]
+        self.serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+    def _get_executor(self):
+        if self.executor is None:
+            if self.executor_kind == 'thread':
+                self.executor = ThreadPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self.executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/generate':
+            headers = dict(scope['headers'])
+            body = await self._read_body(receive, send)
+            if body is None:
+                return
+
+            content_type = headers.get(b'content-type', b'').decode('latin-1')
+            if len(body) > INLINE_PARSE_BYTES:
+                form, files = await asyncio.to_thread(_parse_form, content_type, body)
+            else:
+                form, files = _parse_form(content_type, body)
+
+            generation_type = form.get('generation_type')
+            if generation_type in SINGLE_TYPES:
+                await self._generate(scope, headers, send, generation_type, form, files)
+                return
+            receive = _replay(body, receive)
+
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._get_executor()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive, send):
+        """Read the request body, or answer 413 and return None if it is too large"""
+        limit = flask_app.config['MAX_CONTENT_LENGTH']
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if limit and size > limit:
+                await _send(send, 413, b'Request Entity Too Large', b'text/plain')
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    def _session(self, headers):
+        """Return (session_id, Set-Cookie value or None) from the Flask session cookie"""
+        cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+        value = parse_cookie(headers.get(b'cookie', b'').decode('latin-1')).get(cookie_name)
+        if value:
+            try:
+                data = self.serializer.loads(value, max_age=flask_app.permanent_session_lifetime.total_seconds())
+            except BadSignature:
+                data = {}
+            if 'user_id' in data:
+                return data['user_id'], None
+
+        # Start a session like the Flask app does, so later requests reuse it
+        session_id = str(uuid.uuid4())
+        cookie = dump_cookie(cookie_name, self.serializer.dumps({'user_id': session_id}),
+                             path=flask_app.config['SESSION_COOKIE_PATH'] or '/',
+                             secure=flask_app.config['SESSION_COOKIE_SECURE'],
+                             httponly=flask_app.config['SESSION_COOKIE_HTTPONLY'],
+                             samesite=flask_app.config['SESSION_COOKIE_SAMESITE'])
+        return session_id, cookie
+
+    def _allow(self, scope):
+        """Count the request against the app's default rate limits"""
+        if not limiter.enabled:
+            return True
+        client = (scope.get('client') or ('unknown',))[0]
+        # Same keys as Flask-Limiter's default limits on the generate view
+        # (remote address, endpoint), so both servers share one budget
+        return all(limiter.limiter.hit(limit, client, 'generate') for limit in self.rate_limits)
+
+    async def _generate(self, scope, headers, send, generation_type, form, files):
+        start_time = time.perf_counter()
+        metrics.inc('qr_requests_total', type=generation_type)
+        session_id, cookie = self._session(headers)
+        if cookie is None:
+            metrics.mark_active(session_id)
+
+        try:
+            if not self._allow(scope):
+                await _send(send, 429, json.dumps({'error': 'Rate limit exceeded'}).encode('utf-8'),
+                            b'application/json')
+                return
+
+            result = await self._render(session_id, generation_type, form, files)
+        except Exception as e:
+            logger.error(f"Error in async generate: {str(e)}")
+            result = {'error': f'An error occurred: {str(e)}'}
+        finally:
+            metrics.observe('qr_stage_seconds', time.perf_counter() - start_time,
+                            stage='request', type=generation_type)
+
+        await _send(send, 200, json.dumps(result).encode('utf-8'), b'application/json', cookie)
+
+    async def _render(self, session_id, generation_type, form, files):
+        image = None
+        if generation_type == 'image':
+            file = files.get('file')
+            if file is None:
+                return {'error': 'No image uploaded'}
+            if file.filename == '':
+                return {'error': 'No image selected'}
+            image = file.read()
+
+        loop = asyncio.get_running_loop()
+        with metrics.timer('qr_stage_seconds', stage='encode', type=generation_type):
+            try:
+                if self.executor_kind == 'thread':
+                    png = await loop.run_in_executor(self._get_executor(), render_single_qr,
+                                                     generation_type, form.to_dict(), image)
+                else:
+                    # Worker processes have their own cache, its counters
+                    # are added here for /api/stats and /metrics
+                    png, counters = await loop.run_in_executor(self._get_executor(), render_single_qr_counted,
+                                                               generation_type, form.to_dict(), image)
+                    render_cache.add_counters(counters)
+            except ValueError as e:
+                return {'error': str(e)}
+        metrics.inc('qr_codes_generated_total', type=generation_type)
+
+        # Kept in memory, the file is written off the event loop (utils/previews.py)
+        file_name, message = SINGLE_TYPES[generation_type]
+        preview_store.save(os.path.join(flask_app.config['UPLOAD_FOLDER'], session_id, file_name), png)
+
+        with metrics.timer('qr_stage_seconds', stage='preview', type=generation_type):
+            img_data = base64.b64encode(png).decode('utf-8')
+
+        return {
+            'success': True,
+            'message': message,
+            'download_url': f'/download/{session_id}/{generation_type}_qr',
+            'preview': f'data:image/png;base64,{img_data}'
+        }
+
+app = PreviewApp(flask_app, flask_app.config['PREVIEW_EXECUTOR'], flask_app.config['PREVIEW_WORKERS'])
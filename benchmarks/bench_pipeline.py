@@ -0,0 +1,255 @@
+"""
+Benchmark the QR generation pipeline
+
+Runs every stage of a bulk job (read, encode, PDF layout, ZIP packing) on
+synthetic spreadsheets and reports rows/sec, peak RSS and per-stage timing.
+Each case runs in its own process so peak memory is measured per case.
+
+Examples:
+    python benchmarks/bench_pipeline.py --profile quick
+    python benchmarks/bench_pipeline.py --profile full --save results.json
+    python benchmarks/bench_pipeline.py --baseline results.json --threshold 0.15
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import itertools
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+PROFILES = {
+    'quick': {
+        'rows': [100, 1000],
+        'formats': ['csv'],
+        'styles': ['standard'],
+        'error_levels': ['l'],
+        'outputs': ['pdf', 'zip'],
+        'pdf_renders': ['vector']
+    },
+    'full': {
+        'rows': [100, 1000, 10000, 100000],
+        'formats': ['csv', 'xlsx'],
+        'styles': ['standard', 'rounded'],
+        'error_levels': ['l', 'm', 'q', 'h'],
+        'outputs': ['pdf', 'zip'],
+        'pdf_renders': ['raster', 'vector']
+    }
+}
+
+# Styles of create_styled_qr measured on single codes
+SINGLE_STYLES = ['standard', 'rounded', 'gradient', 'custom']
+
+def make_values(rows, seed=42):
+    """Return reproducible synthetic cell values (SKUs and URLs)"""
+    rng = random.Random(seed)
+    values = []
+    for i in range(rows):
+        if i % 3 == 0:
+            values.append(f"https://example.com/p/{rng.randrange(10 ** 8):08d}")
+        else:
+            values.append(f"SKU-{rng.randrange(10 ** 10):010d}")
+    return values
+
+def write_dataset(path, rows):
+    """Write a synthetic CSV or XLSX file with the codes in column 0"""
+    values = make_values(rows)
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['code', 'description'])
+            for value in values:
+                writer.writerow([value, 'benchmark item'])
+    else:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(['code', 'description'])
+        for value in values:
+            sheet.append([value, 'benchmark item'])
+        workbook.save(path)
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children in MB"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(max(own, children) / divisor, 1)
+
+def run_pipeline_case(case, data_dir, workers):
+    """Run one bulk case and return its timings"""
+    from utils.file_utils import read_file_data
+    from utils.qr_generator import generate_qr_codes, create_qr_pdf, create_qr_zip
+
+    data_path = os.path.join(data_dir, f"data_{case['rows']}.{case['format']}")
+    out_dir = tempfile.mkdtemp(prefix='qr_bench_')
+    timings = {}
+
+    start = time.perf_counter()
+    data = read_file_data(data_path, 0)
+    timings['read'] = time.perf_counter() - start
+
+    vector = case['output'] == 'pdf' and case['pdf_render'] == 'vector' and case['style'] == 'standard'
+    start = time.perf_counter()
+    qr_files = generate_qr_codes(data, out_dir, 50, case['error_level'], workers=workers,
+                                 output='matrix' if vector else 'bytes',
+                                 cache=None, style=case['style'])
+    timings['encode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if case['output'] == 'pdf':
+        create_qr_pdf(qr_files, os.path.join(out_dir, 'qr_codes.pdf'), 50, 5, 0, True, True)
+        output_path = os.path.join(out_dir, 'qr_codes.pdf')
+    else:
+        create_qr_zip(qr_files, os.path.join(out_dir, 'qr_codes.zip'), 50)
+        output_path = os.path.join(out_dir, 'qr_codes.zip')
+    timings[case['output']] = time.perf_counter() - start
+
+    total = sum(timings.values())
+    return {
+        'rows': len(data),
+        'seconds': round(total, 4),
+        'rows_per_sec': round(len(data) / total, 1),
+        'stages': {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        'output_bytes': os.path.getsize(output_path)
+    }
+
+def run_single_case(case, repeat=50):
+    """Render one styled code repeatedly and return its timing"""
+    from utils.qr_generator import create_styled_qr
+
+    out_file = os.path.join(tempfile.mkdtemp(prefix='qr_bench_'), 'styled.png')
+    start = time.perf_counter()
+    for i in range(repeat):
+        create_styled_qr(f"https://example.com/landing/{i}", out_file, 300, 'm', case['style'], cache=None)
+    total = time.perf_counter() - start
+    return {
+        'rows': repeat,
+        'seconds': round(total, 4),
+        'rows_per_sec': round(repeat / total, 1),
+        'stages': {'render': round(total, 4)}
+    }
+
+def case_name(case):
+    if case['kind'] == 'single':
+        return f"single-{case['style']}"
+    parts = [case['format'], case['rows'], case['style'], case['error_level'], case['output']]
+    if case['output'] == 'pdf':
+        parts.append(case['pdf_render'])
+    return "-".join(str(part) for part in parts)
+
+def build_cases(settings):
+    cases = []
+    for rows, fmt, style, error_level, output in itertools.product(
+            settings['rows'], settings['formats'], settings['styles'],
+            settings['error_levels'], settings['outputs']):
+        renders = settings['pdf_renders'] if output == 'pdf' else [None]
+        for pdf_render in renders:
+            cases.append({'kind': 'pipeline', 'rows': rows, 'format': fmt, 'style': style,
+                          'error_level': error_level, 'output': output, 'pdf_render': pdf_render})
+    for style in SINGLE_STYLES:
+        cases.append({'kind': 'single', 'style': style})
+    return cases
+
+def run_case_in_subprocess(case, data_dir, workers):
+    """Run a case in a fresh interpreter so peak RSS is not shared between cases"""
+    command = [sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case),
+               '--data-dir', data_dir]
+    if workers:
+        command += ['--workers', str(workers)]
+    completed = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def compare(results, baseline, threshold):
+    """Return the cases whose throughput dropped by more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        change = result['rows_per_sec'] / previous['rows_per_sec'] - 1
+        result['change_vs_baseline'] = round(change, 3)
+        if change < -threshold:
+            regressions.append((name, previous['rows_per_sec'], result['rows_per_sec'], change))
+    return regressions
+
+def print_report(results):
+    print(f"{'case':<48} {'rows/s':>10} {'peak MB':>8}  stages (s)")
+    for name, result in results.items():
+        stages = ", ".join(f"{stage}={seconds}" for stage, seconds in result['stages'].items())
+        change = result.get('change_vs_baseline')
+        change = f"  ({change:+.1%} vs baseline)" if change is not None else ""
+        print(f"{name:<48} {result['rows_per_sec']:>10} {result['peak_rss_mb']:>8}  {stages}{change}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the QR generation pipeline")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--rows', type=int, nargs='+', help="Row counts to generate")
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'xlsx'])
+    parser.add_argument('--styles', nargs='+', choices=['standard', 'rounded'])
+    parser.add_argument('--error-levels', nargs='+', choices=['l', 'm', 'q', 'h'])
+    parser.add_argument('--outputs', nargs='+', choices=['pdf', 'zip'])
+    parser.add_argument('--pdf-renders', nargs='+', choices=['raster', 'vector'])
+    parser.add_argument('--workers', type=int, help="Encoder processes (default: one per CPU)")
+    parser.add_argument('--save', help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', help="Compare against results saved earlier with --save")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Allowed throughput drop before a case counts as a regression")
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        case = json.loads(args.run_case)
+        if case['kind'] == 'single':
+            result = run_single_case(case)
+        else:
+            result = run_pipeline_case(case, args.data_dir, args.workers)
+        result['peak_rss_mb'] = peak_rss_mb()
+        print(json.dumps(result))
+        return 0
+
+    settings = dict(PROFILES[args.profile])
+    for key in ('rows', 'formats', 'styles', 'error_levels', 'outputs', 'pdf_renders'):
+        if getattr(args, key):
+            settings[key] = getattr(args, key)
+
+    data_dir = tempfile.mkdtemp(prefix='qr_bench_data_')
+    for rows, fmt in itertools.product(settings['rows'], settings['formats']):
+        write_dataset(os.path.join(data_dir, f"data_{rows}.{fmt}"), rows)
+
+    results = {}
+    for case in build_cases(settings):
+        name = case_name(case)
+        results[name] = run_case_in_subprocess(case, data_dir, args.workers)
+        print(f"{name}: {results[name]['rows_per_sec']} rows/s", file=sys.stderr)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.threshold)
+
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'created': time.time(), 'settings': settings, 'results': results}, f, indent=2)
+
+    if regressions:
+        print("\nRegressions:")
+        for name, before, after, change in regressions:
+            print(f"  {name}: {before} -> {after} rows/s ({change:+.1%})")
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
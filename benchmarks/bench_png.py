@@ -0,0 +1,96 @@
+"""
+Benchmark PNG encoding of QR codes
+
+Compares segno's PNG writer with the 1-bit writer used by the app
+(matrix_to_png) at several zlib levels and strategies, reporting the
+encode time and the average file size per code. Every compact PNG is
+checked to decode to the same pixels as segno's.
+
+Examples:
+    python benchmarks/bench_png.py
+    python benchmarks/bench_png.py --sizes 50 300 --levels 1 6 9 --count 5000
+"""
+import os
+import io
+import sys
+import zlib
+import time
+import argparse
+
+import numpy as np
+import segno
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.bench_pipeline import make_values
+from utils.qr_generator import matrix_to_png, PNG_COMPRESS_LEVEL, PNG_STRATEGY
+
+STRATEGIES = {
+    'default': zlib.Z_DEFAULT_STRATEGY,
+    'filtered': zlib.Z_FILTERED,
+    'rle': zlib.Z_RLE
+}
+
+def segno_png(qr, scale, border):
+    buffer = io.BytesIO()
+    qr.save(buffer, kind='png', scale=scale, border=border)
+    return buffer.getvalue()
+
+def measure(encode, codes):
+    """Return (ms per code, average bytes, outputs) of encoding every code"""
+    start = time.perf_counter()
+    outputs = [encode(qr) for qr in codes]
+    seconds = time.perf_counter() - start
+    return seconds * 1000 / len(codes), sum(map(len, outputs)) / len(outputs), outputs
+
+def same_pixels(expected, actual):
+    """True if two lists of PNGs decode to identical images"""
+    for a, b in zip(expected, actual):
+        a = np.asarray(Image.open(io.BytesIO(a)).convert('L'))
+        b = np.asarray(Image.open(io.BytesIO(b)).convert('L'))
+        if a.shape != b.shape or (a != b).any():
+            return False
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PNG encoding of QR codes")
+    parser.add_argument('--count', type=int, default=2000, help="Codes encoded per case")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 300],
+                        help="QR sizes in pixels, as entered in the app (default: 50 300)")
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 6, 9], help="zlib levels")
+    parser.add_argument('--strategies', nargs='+', choices=sorted(STRATEGIES), default=sorted(STRATEGIES))
+    parser.add_argument('--border', type=int, default=1)
+    args = parser.parse_args()
+
+    codes = [segno.make(value, error='l') for value in make_values(args.count)]
+
+    print(f"{'size':>5} {'writer':<24} {'ms/code':>8} {'bytes':>7} {'vs segno':>9}")
+    failed = False
+    for size in args.sizes:
+        scale = max(1, int(size / 25))
+        base_ms, base_bytes, expected = measure(lambda qr: segno_png(qr, scale, args.border), codes)
+        print(f"{size:>5} {'segno':<24} {base_ms:>8.3f} {base_bytes:>7.0f} {'':>9}")
+
+        for level in args.levels:
+            for name in args.strategies:
+                strategy = STRATEGIES[name]
+
+                def encode(qr):
+                    return matrix_to_png(qr.matrix, scale, args.border, compress_level=level,
+                                         strategy=strategy)
+
+                ms, size_bytes, outputs = measure(encode, codes)
+                marker = ' *' if level == PNG_COMPRESS_LEVEL and strategy == PNG_STRATEGY else ''
+                print(f"{size:>5} {f'level {level} {name}{marker}':<24} {ms:>8.3f} {size_bytes:>7.0f} "
+                      f"{size_bytes / base_bytes - 1:>+9.1%}")
+                if not same_pixels(expected, outputs):
+                    print(f"      level {level} {name}: pixels differ from segno's PNG", file=sys.stderr)
+                    failed = True
+
+    print("\n* current setting of matrix_to_png")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Load-test the single-code preview endpoint
+
+Opens many keep-alive HTTP connections to a running server and sends URL
+or vCard generation requests over all of them at once, reporting the
+requests/sec and latency percentiles. Each connection keeps the session
+cookie it was given, like a browser tab. Works against the Flask app
+(gunicorn) and the async entry point in asgi.py (uvicorn) alike; the
+rate limits must be off on the server (RATELIMIT_ENABLED=false).
+
+Examples:
+    RATELIMIT_ENABLED=false uvicorn asgi:app --port 8000 &
+    python benchmarks/load_preview.py --url http://127.0.0.1:8000/generate --concurrency 2000
+    python benchmarks/load_preview.py --type vcard --requests 5000 --repeat
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit, urlencode
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.bench_pipeline import make_values
+
+def make_body(generation_type, value):
+    if generation_type == 'vcard':
+        fields = {'name': 'Load Test', 'phone': value[-10:], 'email': 'load@example.com'}
+    else:
+        fields = {'url': value}
+    return urlencode(dict(fields, generation_type=generation_type, qr_size=300)).encode('ascii')
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection with its own session cookie"""
+
+    def __init__(self, host, port, path):
+        self.host, self.port, self.path = host, port, path
+        self.reader = self.writer = None
+        self.cookie = None
+
+    async def post(self, body):
+        """Send a form and return (status, response body)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        headers = [f"POST {self.path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                   "Content-Type: application/x-www-form-urlencoded", f"Content-Length: {len(body)}"]
+        if self.cookie:
+            headers.append(f"Cookie: {self.cookie}")
+        self.writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + body)
+
+        head = (await self.reader.readuntil(b"\r\n\r\n")).decode('latin-1').split("\r\n")
+        status = int(head[0].split()[1])
+        length, close = None, False
+        for line in head[1:]:
+            name, _, value = line.partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'set-cookie':
+                morsel = next(iter(SimpleCookie(value).values()))
+                self.cookie = f"{morsel.key}={morsel.value}"
+            elif name == 'connection' and value.lower() == 'close':
+                close = True
+
+        data = await self.reader.readexactly(length) if length is not None else await self.reader.read()
+        if close or length is None:
+            await self.close()
+        return status, data
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+async def run(args, bodies):
+    url = urlsplit(args.url)
+    queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+
+    latencies = []
+    errors = {}
+
+    async def client():
+        connection = Connection(url.hostname, url.port or 80, url.path or '/')
+        while not queue.empty():
+            body = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                status, data = await connection.post(body)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                await connection.close()
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200 or b'"success"' not in data:
+                errors[f'HTTP {status}'] = errors.get(f'HTTP {status}', 0) + 1
+        await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    return time.perf_counter() - start, latencies, errors
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the single-code preview endpoint")
+    parser.add_argument('--url', default='http://127.0.0.1:8000/generate')
+    parser.add_argument('--type', choices=['url', 'vcard'], default='url', help="Kind of code requested")
+    parser.add_argument('--requests', type=int, default=10000, help="Total requests sent")
+    parser.add_argument('--concurrency', type=int, default=1000, help="Connections open at the same time")
+    parser.add_argument('--repeat', action='store_true',
+                        help="Request the same code every time (render cache hits) instead of distinct ones")
+    args = parser.parse_args()
+
+    # Every connection needs a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.concurrency + 64:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, args.concurrency + 64), hard))
+
+    values = make_values(1) * args.requests if args.repeat else make_values(args.requests)
+    bodies = [make_body(args.type, value) for value in values]
+
+    seconds, latencies, errors = asyncio.run(run(args, bodies))
+    latencies.sort()
+
+    print(f"{len(latencies)} responses in {seconds:.2f}s: {len(latencies) / seconds:.0f} requests/s "
+          f"with {args.concurrency} connections")
+    print("latency ms: " + ", ".join(f"p{int(q * 100)}={percentile(latencies, q) * 1000:.1f}"
+                                     for q in (0.5, 0.95, 0.99)) +
+          f", max={(latencies[-1] if latencies else 0) * 1000:.1f}")
+    if errors:
+        print("errors: " + ", ".join(f"{name}={count}" for name, count in sorted(errors.items())))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
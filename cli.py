@@ -0,0 +1,272 @@
+"""
+Generate QR codes from the command line, without the web app
+
+Streams a spreadsheet column (or stdin) through the same pipeline as the
+web app, using all CPU cores, and writes a PDF, a ZIP and/or a directory
+of PNG images. No upload size or rate limits apply.
+
+Examples:
+    python cli.py products.xlsx --column 2 --pdf labels.pdf --text --page-numbers
+    python cli.py catalog.csv --zip codes.zip --dir codes/ --workers 8
+    python cli.py catalog.csv --zip codes.zip --format svg --svg-sheet sheet.svg
+    python cli.py products.csv --pdf labels.pdf --layout avery-5160 --text
+    seq 1 100000 | python cli.py - --lines --pdf numbers.pdf
+
+Use --work-dir to keep the job checkpoint: running the same command again
+after an interruption resumes where it stopped.
+
+Jobs too large for one machine can be split into shards of consecutive
+rows. --shards plans the split in a work directory shared by all nodes,
+every node then runs one shard and a final merge stitches the parts:
+
+    python cli.py catalog.csv --pdf codes.pdf --shards 4 --plan-only --work-dir /shared/job
+    python cli.py --manifest /shared/job/shards.json --run-shard 0   # on each node, 0 to 3
+    python cli.py --manifest /shared/job/shards.json --merge
+
+Without --plan-only the shards run as local processes and are merged
+right away.
+"""
+import os
+import sys
+import csv
+import time
+import shutil
+import subprocess
+import argparse
+import logging
+import tempfile
+from utils.pipeline import run_bulk_generation
+from utils.qr_generator import fit_qr_size, BULK_STYLES, IMAGE_FORMATS, PAGE_LAYOUTS, MIN_QR_SIZE
+from utils.sharding import load_manifest, plan_shards, run_shard, merge_shards
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress lines on stderr
+PROGRESS_INTERVAL = 2.0
+
+def spool_stdin(work_dir, lines):
+    """Copy stdin to a CSV file in work_dir, since the pipeline reads its input twice"""
+    path = os.path.join(work_dir, 'stdin.csv')
+    with open(path, 'w', newline='') as f:
+        if lines:
+            # One value per line, written as a single-column CSV
+            writer = csv.writer(f)
+            writer.writerow(['value'])
+            for line in sys.stdin:
+                writer.writerow([line.rstrip('\r\n')])
+        else:
+            shutil.copyfileobj(sys.stdin, f)
+    return path
+
+class ProgressPrinter:
+    """Print pipeline progress counters to stderr every few seconds"""
+
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        self.interval = interval
+        self.counters = {}
+        self.start = time.perf_counter()
+        self.last = 0.0
+
+    def __call__(self, **counters):
+        self.counters.update(counters)
+        now = time.perf_counter()
+        if now - self.last < self.interval:
+            return
+        self.last = now
+
+        rows = self.counters.get('rows_encoded', 0)
+        line = f"{rows} rows encoded ({rows / (now - self.start):.0f} rows/s)"
+        if 'total_pages' in self.counters:
+            line += f", {self.counters.get('pages_written', 0)}/{self.counters['total_pages']} pages"
+        print(line, file=sys.stderr)
+
+def build_options(args):
+    if args.pdf and args.zip:
+        download_type = 'both'
+    elif args.zip:
+        download_type = 'zip'
+    elif args.pdf:
+        download_type = 'pdf'
+    else:
+        download_type = None
+
+    qr_size = max(args.size, MIN_QR_SIZE)  # Minimum size for reliable scanning
+    if args.auto_fit:
+        qr_size = fit_qr_size(qr_size, args.page_margin, args.qr_margin, args.text, args.layout)
+
+    return {
+        'column_index': args.column,
+        'max_rows': args.max_rows,
+        'qr_size': qr_size,
+        'page_margin': args.page_margin,
+        'qr_margin': args.qr_margin,
+        'include_text': args.text,
+        'include_page_numbers': args.page_numbers,
+        'error_level': args.error_level,
+        'download_type': download_type,
+        'pdf_render': args.render,
+        'style': args.style,
+        'workers': args.workers,
+        'chunk_size': args.chunk_size,
+        'shared_masks': args.shared_mask,
+        'in_memory': True,
+        'stream_zip': False,
+        'pdf_path': os.path.abspath(args.pdf) if args.pdf else None,
+        'zip_path': os.path.abspath(args.zip) if args.zip else None,
+        'image_dir': os.path.abspath(args.dir) if args.dir else None,
+        'image_format': args.format,
+        'svg_sheet': bool(args.svg_sheet),
+        'page_layout': args.layout,
+        'sheet_path': os.path.abspath(args.svg_sheet) if args.svg_sheet else None
+    }
+
+def print_summary(result, seconds):
+    """Print the totals and throughput of a finished run"""
+    stats = result['stats']
+    total = stats['total_qr_codes']
+    print(f"Generated {total} QR codes ({stats['unique_qr_codes']} unique) in {seconds:.1f}s: "
+          f"{total / seconds:.0f} rows/s")
+    if 'micro_qr_codes' in stats:
+        print(f"Encoded {stats['micro_qr_codes']} Micro QR and {stats['standard_qr_codes']} standard QR symbols")
+    if 'total_pages' in stats:
+        print(f"PDF: {result['pdf_path']} ({stats['total_pages']} pages, {stats['qr_per_page']} per page)")
+    if 'zip_path' in result:
+        print(f"ZIP: {result['zip_path']}")
+    if 'image_dir' in result:
+        print(f"Images: {result['image_dir']}")
+    if 'sheet_path' in result:
+        print(f"SVG sheet: {result['sheet_path']}")
+    if 'resumed_from_row' in stats:
+        print(f"Resumed from row {stats['resumed_from_row']}")
+    if 'shards' in result:
+        print(f"Merged {result['shards']} shards")
+    print("Stages: " + ", ".join(f"{stage}={seconds}s" for stage, seconds in result['timings'].items()))
+
+def run_shards_locally(manifest_path, workers, quiet):
+    """Run every shard of a manifest in its own process, as if on separate nodes"""
+    shards = len(load_manifest(manifest_path)['shards'])
+    workers = workers or max(1, (os.cpu_count() or 1) // shards)
+    processes = []
+    for index in range(shards):
+        command = [sys.executable, os.path.abspath(__file__), '--manifest', manifest_path,
+                   '--run-shard', str(index), '--workers', str(workers)]
+        if quiet:
+            command.append('--quiet')
+        processes.append(subprocess.Popen(command))
+    failed = [index for index, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        raise RuntimeError(f"Shards failed: {', '.join(str(index) for index in failed)}")
+
+def run_sharded(args, parser):
+    """Handle --manifest with --run-shard or --merge"""
+    if args.run_shard is not None:
+        start = time.perf_counter()
+        status = run_shard(args.manifest, args.run_shard, args.workers,
+                           None if args.quiet else ProgressPrinter())
+        print(f"Shard {status['index']}: {status['rows']} rows in {status['seconds']}s: "
+              f"{status['rows'] / (time.perf_counter() - start):.0f} rows/s")
+    elif args.merge:
+        result = merge_shards(args.manifest, args.pdf, args.zip, args.svg_sheet)
+        print_summary(result, result['seconds'])
+    else:
+        parser.error("--manifest needs --run-shard or --merge")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate QR codes from a spreadsheet column")
+    parser.add_argument('input', nargs='?', help="Excel/CSV file, or - to read CSV from stdin")
+    parser.add_argument('--column', type=int, default=0, help="Column index holding the QR content (default: 0)")
+    parser.add_argument('--max-rows', type=int, help="Only process this many rows")
+    parser.add_argument('--lines', action='store_true', help="Read stdin as one value per line instead of CSV")
+    parser.add_argument('--pdf', help="Write a PDF with the codes arranged in a grid")
+    parser.add_argument('--zip', help="Write a ZIP archive with one image per code")
+    parser.add_argument('--dir', help="Write one image per code into this directory")
+    parser.add_argument('--format', choices=IMAGE_FORMATS, default='png',
+                        help="Format of the images in --zip and --dir (default: png)")
+    parser.add_argument('--svg-sheet', help="Write every code onto one combined SVG sheet")
+    parser.add_argument('--size', type=int, default=50, help="QR code size in points/pixels (default: 50)")
+    parser.add_argument('--layout', choices=PAGE_LAYOUTS, default='a4',
+                        help="Paper size or label sheet of the PDF (default: a4)")
+    parser.add_argument('--auto-fit', action='store_true',
+                        help="Treat --size as a minimum and enlarge the codes to fill the page")
+    parser.add_argument('--page-margin', type=int, default=5)
+    parser.add_argument('--qr-margin', type=int, default=0)
+    parser.add_argument('--text', action='store_true', help="Print the value below each code in the PDF")
+    parser.add_argument('--page-numbers', action='store_true', help="Number the PDF pages")
+    parser.add_argument('--error-level', choices=['l', 'm', 'q', 'h'], default='l')
+    parser.add_argument('--render', choices=['vector', 'raster'], default='vector',
+                        help="Draw PDF codes as vector shapes or embedded images (default: vector)")
+    parser.add_argument('--style', choices=BULK_STYLES, default='standard')
+    parser.add_argument('--shared-mask', action='store_true',
+                        help="Share one mask per value length and type instead of scoring the masks of "
+                             "every code: several times faster, but codes may scan less reliably")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per CPU core)")
+    parser.add_argument('--chunk-size', type=int, help="Rows handed to a worker at a time")
+    parser.add_argument('--work-dir', help="Keep the job checkpoint here so an interrupted run can resume")
+    parser.add_argument('--shards', type=int, help="Split the job into this many shards of consecutive rows")
+    parser.add_argument('--plan-only', action='store_true',
+                        help="With --shards, only write the manifest for the nodes to pick up")
+    parser.add_argument('--manifest', help="Shard manifest written by --shards")
+    parser.add_argument('--run-shard', type=int, metavar='INDEX', help="Generate one shard of --manifest")
+    parser.add_argument('--merge', action='store_true', help="Merge the finished shards of --manifest")
+    parser.add_argument('--quiet', action='store_true', help="Do not print progress")
+    parser.add_argument('--verbose', action='store_true', help="Log pipeline details")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    try:
+        if args.manifest:
+            return run_sharded(args, parser)
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if not args.input:
+        parser.error("the input file is required")
+    if not (args.pdf or args.zip or args.dir or args.svg_sheet):
+        parser.error("choose at least one output with --pdf, --zip, --dir or --svg-sheet")
+    if args.plan_only and not (args.shards and args.work_dir):
+        parser.error("--plan-only needs --shards and a shared --work-dir")
+    if args.input != '-' and not os.path.exists(args.input):
+        parser.error(f"{args.input} does not exist")
+
+    if args.work_dir:
+        work_dir = args.work_dir
+        os.makedirs(work_dir, exist_ok=True)
+    else:
+        work_dir = tempfile.mkdtemp(prefix='qr_cli_')
+
+    try:
+        if args.input == '-':
+            file_path = spool_stdin(work_dir, args.lines)
+            if args.lines:
+                args.column = 0
+        else:
+            file_path = os.path.abspath(args.input)
+
+        start = time.perf_counter()
+        progress = None if args.quiet else ProgressPrinter()
+        try:
+            if args.shards:
+                manifest_path = plan_shards(file_path, work_dir, build_options(args), args.shards)
+                if args.plan_only:
+                    print(f"Wrote {manifest_path}")
+                    return 0
+                run_shards_locally(manifest_path, args.workers, args.quiet)
+                result = merge_shards(manifest_path)
+            else:
+                result = run_bulk_generation(file_path, work_dir, build_options(args), progress)
+        except (ValueError, RuntimeError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print_summary(result, time.perf_counter() - start)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
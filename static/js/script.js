@@ -52,36 +52,20 @@ function setupExcelForm() {
         })
         .then(response => response.json())
         .then(data => {
-            hideLoading();
-            
             if (data.error) {
+                hideLoading();
                 showError(data.error);
                 return;
             }
             
-            // Prepare download links based on download type
-            const downloadLinks = [];
-            
-            if (data.pdf_url) {
-                downloadLinks.push({
-                    url: data.pdf_url,
-                    label: 'Download PDF'
-                });
-            }
-            
-            if (data.zip_url) {
-                downloadLinks.push({
-                    url: data.zip_url,
-                    label: 'Download ZIP'
-                });
+            // Large jobs run in the background, poll until they finish
+            if (data.job_id) {
+                pollJob(data.status_url);
+                return;
             }
             
-            // Show results with download links
-            showResults({
-                message: data.message,
-                download_links: downloadLinks,
-                stats: data.stats
-            });
+            hideLoading();
+            showExcelResults(data);
         })
         .catch(error => {
             hideLoading();
@@ -91,6 +75,50 @@ function setupExcelForm() {
     });
 }
 
+function pollJob(statusUrl) {
+    fetch(statusUrl)
+    .then(response => response.json())
+    .then(job => {
+        if (job.status === 'done') {
+            hideLoading();
+            showExcelResults(job.result);
+            return;
+        }
+        
+        if (job.status === 'failed' || job.error) {
+            hideLoading();
+            showError(`Error generating QR codes: ${job.error}`);
+            return;
+        }
+        
+        // Show progress while the job is running
+        const progress = job.progress || {};
+        let message = 'Generating QR Codes...';
+        if (progress.pages_written) {
+            message = `Writing PDF page ${progress.pages_written} of ${progress.total_pages}...`;
+        } else if (progress.rows_encoded) {
+            message = `Encoded ${progress.rows_encoded} QR codes...`;
+        }
+        setLoadingMessage(message);
+        
+        setTimeout(() => pollJob(statusUrl), 1000);
+    })
+    .catch(error => {
+        hideLoading();
+        showError('Lost track of the QR code generation job. Please try again.');
+        console.error('Error:', error);
+    });
+}
+
+function showExcelResults(data) {
+    // The server lists a link for every file the job produced (PDF, ZIP, SVG sheet)
+    showResults({
+        message: data.message,
+        download_links: data.download_links || [],
+        stats: data.stats
+    });
+}
+
 
 function setupUrlForm() {
     const form = document.getElementById('urlForm');
@@ -289,6 +317,14 @@ function showLoading() {
 function hideLoading() {
     const loadingOverlay = document.getElementById('loadingOverlay');
     loadingOverlay.style.display = 'none';
+    setLoadingMessage('Generating QR Codes...');
+}
+
+function setLoadingMessage(message) {
+    const loadingMessage = document.getElementById('loadingMessage');
+    if (loadingMessage) {
+        loadingMessage.textContent = message;
+    }
 }
 
 function showError(message) {
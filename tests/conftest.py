@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# The tests import the app's modules the way app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def write_csv(tmp_path):
+    """Write values as the single column of a CSV upload and return its path"""
+    def write(values, name='upload.csv'):
+        path = tmp_path / name
+        path.write_text('value\n' + '\n'.join(values) + '\n')
+        return str(path)
+    return write
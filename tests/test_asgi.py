@@ -0,0 +1,40 @@
+import asyncio
+
+from limits import parse
+from werkzeug.datastructures import MultiDict
+
+from app import app as flask_app, limiter, DEFAULT_LIMITS
+from asgi import PreviewApp
+from utils.qr_cache import render_cache
+
+def test_async_and_flask_generate_share_one_rate_limit():
+    client = '10.1.2.3'
+    preview = PreviewApp(flask_app, 'thread', 1)
+
+    flask_app.test_client().post('/generate', data={'generation_type': 'url'},
+                                 environ_base={'REMOTE_ADDR': client})
+    assert preview._allow({'client': (client, 4000)})
+
+    for limit in map(parse, DEFAULT_LIMITS):
+        _, remaining = limiter.limiter.get_window_stats(limit, client, 'generate')
+        assert remaining == limit.amount - 2
+
+def test_cache_counters_of_worker_processes_are_reported(tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    preview = PreviewApp(flask_app, 'process', 1)
+    form = MultiDict({'url': 'https://example.com/counted', 'qr_size': '100'})
+    before = render_cache.stats()
+
+    async def render_twice():
+        for _ in range(2):
+            result = await preview._render('session', 'url', form, {})
+            assert result['success']
+
+    try:
+        asyncio.run(render_twice())
+    finally:
+        preview.executor.shutdown()
+
+    after = render_cache.stats()
+    assert after['misses'] - before['misses'] == 1
+    assert after['hits'] - before['hits'] == 1
@@ -0,0 +1,56 @@
+import os
+import zipfile
+import multiprocessing
+
+import pytest
+
+from utils import pipeline
+from utils.checkpoint import CHECKPOINT_FILE
+
+ROWS = 9000
+
+def _exit_after(items, count):
+    for i, item in enumerate(items):
+        if i == count:
+            # Dies like a killed server process: nothing is cleaned up
+            os._exit(1)
+        yield item
+
+def _crash_in_second_zip_batch(file_path, session_dir, options):
+    real_create_qr_zip = pipeline.create_qr_zip
+    calls = []
+
+    def create_qr_zip(qr_files, *args, **kwargs):
+        calls.append(qr_files)
+        if len(calls) == 2:
+            qr_files = _exit_after(qr_files, 1000)
+        return real_create_qr_zip(qr_files, *args, **kwargs)
+
+    pipeline.create_qr_zip = create_qr_zip
+    pipeline.run_bulk_generation(file_path, session_dir, options)
+
+def _run_crashing(file_path, session_dir, options):
+    process = multiprocessing.get_context('fork').Process(
+        target=_crash_in_second_zip_batch, args=(file_path, session_dir, options))
+    process.start()
+    process.join()
+    assert process.exitcode == 1
+
+@pytest.mark.parametrize('download_type', ['zip', 'both'])
+def test_resume_after_crash_keeps_every_zip_entry(tmp_path, write_csv, download_type):
+    file_path = write_csv([f"SKU-{i:06d}" for i in range(ROWS)])
+    session_dir = tmp_path / 'session'
+    session_dir.mkdir()
+    options = {'qr_size': 50, 'download_type': download_type, 'workers': 1}
+
+    _run_crashing(file_path, str(session_dir), options)
+    assert (session_dir / CHECKPOINT_FILE).exists()
+
+    result = pipeline.run_bulk_generation(file_path, str(session_dir), options)
+
+    assert result['stats']['resumed_from_row'] > 0
+    assert result['stats']['micro_qr_codes'] + result['stats']['standard_qr_codes'] == ROWS
+    with zipfile.ZipFile(result['zip_path']) as zipf:
+        assert zipf.testzip() is None
+        assert len(zipf.namelist()) == ROWS
+    assert not (session_dir / CHECKPOINT_FILE).exists()
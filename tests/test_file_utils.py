@@ -0,0 +1,24 @@
+import datetime
+
+from openpyxl import Workbook
+
+from utils.file_utils import read_file_data
+
+def test_xlsx_numbers_are_read_as_written(tmp_path):
+    # pandas read a numeric column with blanks as floats ('1.0') and the
+    # blanks as 'nan'; whole numbers now stay whole and blanks are skipped
+    path = str(tmp_path / 'upload.xlsx')
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['sku', 'other'])
+    for value in [1, None, 2, 3.5, 'A-1', datetime.datetime(2024, 1, 2), '  ']:
+        sheet.append([value, 'x'])
+    workbook.save(path)
+
+    assert read_file_data(path, 0) == ['1', '2', '3.5', 'A-1', '2024-01-02 00:00:00']
+
+def test_csv_values_are_read_as_text(tmp_path, write_csv):
+    # Leading zeros and whole numbers are kept as written, blanks skipped
+    path = write_csv(['007', '', '1', '2.50'])
+
+    assert read_file_data(path, 0) == ['007', '1', '2.50']
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_job_runs_under_gevent_monkey_patching(tmp_path, write_csv):
+    pytest.importorskip('gevent')
+    file_path = write_csv([f"SKU-{i}" for i in range(600)])
+    # Patching is process wide, so the job runs in a fresh interpreter like
+    # a gunicorn gevent worker
+    script = textwrap.dedent(f"""
+        from gevent import monkey
+        monkey.patch_all()
+
+        import gevent
+        from gevent.threadpool import ThreadPoolExecutor
+        from utils.jobs import JobManager
+        from utils.pipeline import run_bulk_generation
+
+        jobs = JobManager(max_workers=1)
+        assert isinstance(jobs.executor, ThreadPoolExecutor)
+        options = {{'qr_size': 50, 'download_type': 'both', 'workers': 2, 'chunk_size': 50}}
+        job_id = jobs.submit({str(tmp_path)!r}, run_bulk_generation, {file_path!r}, {str(tmp_path)!r}, options)
+
+        try:
+            # The hub keeps serving greenlets while the job runs
+            ticks = 0
+            while jobs.get({str(tmp_path)!r}, job_id)['status'] in ('queued', 'running'):
+                gevent.sleep(0.01)
+                ticks += 1
+        finally:
+            jobs.executor.shutdown()
+        job = jobs.get({str(tmp_path)!r}, job_id)
+        assert job['status'] == 'done', job
+        assert job['result']['stats']['total_qr_codes'] == 600
+        assert ticks > 0
+    """)
+
+    process = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True,
+                             timeout=60)
+
+    assert process.returncode == 0, process.stderr
+    assert os.path.exists(tmp_path / 'qr_codes.pdf')
+    assert os.path.exists(tmp_path / 'qr_codes.zip')
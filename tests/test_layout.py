@@ -0,0 +1,18 @@
+import pytest
+from reportlab.lib.pagesizes import A4, letter
+
+from utils.qr_generator import LABEL_PRESETS
+
+PAGES = {'a4': A4, 'letter': letter}
+
+@pytest.mark.parametrize('name', sorted(LABEL_PRESETS))
+def test_label_presets_are_centred_on_their_page(name):
+    # The vendor templates leave the same margin on both sides of the sheet
+    preset = LABEL_PRESETS[name]
+    width, height = PAGES[preset['page_size']]
+
+    right = width - preset['left'] - (preset['cols'] - 1) * preset['h_pitch'] - preset['label_width']
+    bottom = height - preset['top'] - (preset['rows'] - 1) * preset['v_pitch'] - preset['label_height']
+
+    assert right == pytest.approx(preset['left'], abs=0.1)
+    assert bottom == pytest.approx(preset['top'], abs=0.1)
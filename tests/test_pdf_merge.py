@@ -0,0 +1,18 @@
+import os
+
+import pypdf
+
+from utils.qr_generator import iter_qr_codes, create_qr_pdf
+
+def test_parts_share_the_images_of_values_repeated_across_them(tmp_path):
+    # 100 values, each on every one of the 8 pages, laid out 2 pages per part
+    values = [f"https://example.com/p/{i % 100}" for i in range(8 * 176)]
+    qr_codes = list(iter_qr_codes(values, str(tmp_path), 50, workers=1, output='bytes', cache=None))
+
+    serial_path = str(tmp_path / 'serial.pdf')
+    merged_path = str(tmp_path / 'merged.pdf')
+    create_qr_pdf(qr_codes, serial_path, 50, 5, 0, workers=1)
+    create_qr_pdf(qr_codes, merged_path, 50, 5, 0, workers=2, pages_per_part=2)
+
+    assert len(pypdf.PdfReader(merged_path).pages) == 8
+    assert os.path.getsize(merged_path) <= os.path.getsize(serial_path) * 1.05
@@ -0,0 +1,92 @@
+import os
+import zipfile
+
+import pypdf
+import pytest
+
+from utils.pipeline import run_bulk_generation, stream_zip_download
+from utils.sharding import plan_shards, run_shard, merge_shards
+
+LONG_URL = 'https://example.com/' + 'x' * 40
+
+# Distinct values whose file names collide once sanitized or truncated,
+# 'A_1_2' also collides with the name given to the second of them
+COLLIDING = ['A-1', 'A_1', 'A 1', 'A-1', LONG_URL + 'one', LONG_URL + 'two', 'A_1_2']
+
+def _zip_names(path):
+    with zipfile.ZipFile(path) as zipf:
+        return zipf.namelist()
+
+def test_zip_writers_keep_one_entry_per_distinct_value(tmp_path, write_csv):
+    values = COLLIDING * 3 + [f"v{i}" for i in range(500)] + ['A_1']
+    file_path = write_csv(values)
+    options = {'qr_size': 50, 'download_type': 'zip', 'workers': 2, 'chunk_size': 50,
+               'image_dir': str(tmp_path / 'images')}
+
+    session_dir = tmp_path / 'session'
+    session_dir.mkdir()
+    names = _zip_names(run_bulk_generation(file_path, str(session_dir), options)['zip_path'])
+
+    assert len(names) == len(set(values))
+    assert names[:6] == ['A_1.png', 'A_1_2.png', 'A_1_3.png',
+                         'https___example_com_' + 'x' * 30 + '.png',
+                         'https___example_com_' + 'x' * 30 + '_2.png', 'A_1_2_2.png']
+    assert sorted(os.listdir(options['image_dir'])) == sorted(names)
+
+    stream_dir = tmp_path / 'stream'
+    stream_dir.mkdir()
+    run_bulk_generation(file_path, str(stream_dir), dict(options, stream_zip=True, image_dir=None))
+    stream_path = tmp_path / 'stream.zip'
+    with open(stream_path, 'wb') as f:
+        for chunk in stream_zip_download(str(stream_dir), workers=1):
+            f.write(chunk)
+    assert _zip_names(stream_path) == names
+
+    shard_options = dict(options, image_dir=str(tmp_path / 'shard_images'))
+    manifest = plan_shards(file_path, str(tmp_path / 'shards'), shard_options, 3)
+    for shard in range(3):
+        run_shard(manifest, shard)
+    assert _zip_names(merge_shards(manifest)['zip_path']) == names
+    assert sorted(os.listdir(shard_options['image_dir'])) == sorted(names)
+
+def _pdf_pages(path):
+    reader = pypdf.PdfReader(path)
+    return [(page.extract_text(), [image.data for image in page.images]) for page in reader.pages]
+
+def _zip_entries(path):
+    with zipfile.ZipFile(path) as zipf:
+        return [(name, zipf.read(name)) for name in zipf.namelist()]
+
+@pytest.mark.parametrize('style', ['standard', 'rounded'])
+def test_parallel_jobs_match_serial_ones(tmp_path, write_csv, style):
+    # Repeated values and codes of several symbol sizes across chunk boundaries
+    values = [f"SKU-{i % 250:05d}" if i % 3 else f"https://example.com/item/{i}" for i in range(600)]
+    file_path = write_csv(values)
+
+    results = {}
+    for workers in (1, 3):
+        session_dir = tmp_path / f"workers_{workers}"
+        session_dir.mkdir()
+        options = {'qr_size': 50, 'download_type': 'both', 'include_text': True, 'style': style,
+                   'workers': workers, 'chunk_size': 32}
+        results[workers] = run_bulk_generation(file_path, str(session_dir), options)
+
+    serial, parallel = results[1], results[3]
+    assert _zip_entries(serial['zip_path']) == _zip_entries(parallel['zip_path'])
+    assert _pdf_pages(serial['pdf_path']) == _pdf_pages(parallel['pdf_path'])
+    for key in ('total_qr_codes', 'unique_qr_codes', 'total_pages', 'micro_qr_codes', 'standard_qr_codes'):
+        assert serial['stats'][key] == parallel['stats'][key]
+
+@pytest.mark.parametrize('rows, streamed', [(20, True), (21, False)])
+def test_only_small_zips_are_streamed(tmp_path, write_csv, rows, streamed):
+    file_path = write_csv([f"SKU-{i}" for i in range(rows)])
+    options = {'qr_size': 50, 'download_type': 'zip', 'workers': 1,
+               'stream_zip': True, 'stream_zip_max_rows': 20}
+
+    result = run_bulk_generation(file_path, str(tmp_path), options)
+
+    assert ('zip_manifest' in result) == streamed
+    assert ('zip_path' in result) != streamed
+    if not streamed:
+        assert len(_zip_names(result['zip_path'])) == rows
+    assert result['stats']['total_qr_codes'] == rows
@@ -0,0 +1,49 @@
+import io
+import os
+
+import pytest
+import numpy as np
+from PIL import Image
+
+from utils.qr_cache import QRRenderCache
+from utils.qr_generator import iter_qr_codes
+
+def test_dedupe_reuses_files_of_values_dropped_while_read_ahead(tmp_path):
+    # X is looked up when its second chunk is read ahead, then dropped from
+    # the 5 remembered values by the chunks finishing in between
+    values = [f"A{i}" for i in range(9)] + ['X'] + [f"B{i}" for i in range(40)] + ['X'] + [f"C{i}" for i in range(9)]
+
+    qr_codes = list(iter_qr_codes(values, str(tmp_path), 50, workers=2, chunk_size=10,
+                                  output='file', cache=None, dedupe_items=5))
+
+    assert [code for _, code in qr_codes] == values
+    first, second = qr_codes[9][0], qr_codes[50][0]
+    assert first == second == os.path.join(str(tmp_path), 'qr_9.png')
+    assert all(os.path.exists(path) for path, _ in qr_codes)
+
+def test_symbols_are_counted_per_row_whether_encoded_or_reused(tmp_path):
+    # 12345 fits a Micro QR symbol, the URLs need standard ones
+    values = ['12345', 'https://example.com/a', '12345', 'https://example.com/b'] * 3
+    cache = QRRenderCache()
+
+    for _ in range(2):
+        symbols = {}
+        list(iter_qr_codes(values, str(tmp_path), 50, workers=1, output='bytes',
+                           cache=cache, symbols=symbols))
+        assert symbols == {'micro': 6, 'standard': 6}
+
+@pytest.mark.parametrize('qr_size', [25, 50, 100, 300])
+def test_rounded_codes_differ_from_standard_ones(tmp_path, qr_size):
+    images = {}
+    for style in ('standard', 'rounded'):
+        (payload, _), = iter_qr_codes(['https://example.com'], str(tmp_path), qr_size, workers=1,
+                                      output='bytes', cache=None, style=style)
+        images[style] = Image.open(io.BytesIO(payload)).convert('RGBA')
+
+    standard, rounded = images['standard'], images['rounded']
+    assert standard.size == rounded.size
+    # Module corners are cut off, so some dark pixels of the standard code
+    # are (partly) transparent in the rounded one
+    dark = np.asarray(standard.convert('L')) < 128
+    alpha = np.asarray(rounded.getchannel('A'))
+    assert (alpha[dark] < 255).any()
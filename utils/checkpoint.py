@@ -0,0 +1,105 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs of one session are not locked against each other
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Files kept in the session directory while a bulk job is running
+CHECKPOINT_FILE = 'checkpoint.json'
+LOCK_FILE = 'checkpoint.lock'
+PARTS_DIR = 'parts'
+
+# Bumped when the state layout changes, older checkpoints are not resumed
+CHECKPOINT_VERSION = 2
+
+def job_fingerprint(file_path, options, keys):
+    """Hash the uploaded file and the options (by key) that affect the output"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    digest.update(json.dumps({key: options.get(key) for key in keys}, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+class Checkpoint:
+    """
+    Progress of a bulk job, saved in the session directory
+
+    The state records how many rows have been fully written and the PDF
+    and ZIP part files holding them (parts written after that are written
+    again on resume). A job
+    for the same upload and options started after a crash picks up from
+    there instead of starting over. Use as a context manager to hold the
+    session's job lock while working.
+    """
+
+    def __init__(self, session_dir, fingerprint):
+        self.path = os.path.join(session_dir, CHECKPOINT_FILE)
+        self.lock_path = os.path.join(session_dir, LOCK_FILE)
+        self.parts_dir = os.path.join(session_dir, PARTS_DIR)
+        self.fingerprint = fingerprint
+        self.lock_file = None
+        self.state = None
+        self.resumed_from = 0
+
+    def __enter__(self):
+        self.lock_file = open(self.lock_path, 'w')
+        if fcntl:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.lock_file.close()
+                raise RuntimeError('Another job is already generating QR codes for this session')
+        self.state = self._load()
+        return self
+
+    def __exit__(self, *exc_info):
+        # The lock is released when the file is closed, or when the process dies
+        self.lock_file.close()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+
+        if state and state.get('version') == CHECKPOINT_VERSION and state.get('fingerprint') == self.fingerprint:
+            logger.info(f"Resuming bulk job from row {state['rows_done']}")
+            self.resumed_from = state['rows_done']
+            return state
+
+        # Different upload or options: nothing from the old job can be reused
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        os.makedirs(self.parts_dir)
+        return {
+            'version': CHECKPOINT_VERSION,
+            'fingerprint': self.fingerprint,
+            'rows_done': 0,
+            'pdf_parts': [],
+            'zip_parts': []
+        }
+
+    def save(self, **changes):
+        """Update the state and write it atomically"""
+        self.state.update(changes)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Remove the checkpoint once the outputs are complete"""
+        for path in (self.path, self.lock_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
@@ -1,4 +1,8 @@
+import io
 import os
+import zipfile
+import math
+import itertools
 import pandas as pd
 import time
 import shutil
@@ -10,37 +14,129 @@ def allowed_file(filename, allowed_extensions):
     """Check if the file has an allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
-def read_file_data(file_path, column_index, max_rows=None):
-    """Read data from uploaded file based on file type"""
-    file_ext = os.path.splitext(file_path)[1].lower()
+def _clean_values(values):
+    """Convert cell values to strings, skipping blank/NA cells"""
+    for value in values:
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        value = str(value)
+        if value.strip() == '':
+            continue
+        yield value
+
+def _check_column(column_index, column_count):
+    if column_index >= column_count:
+        raise ValueError(f"Column index {column_index} out of range. File has {column_count} columns.")
+
+def _iter_csv_column(file_path, column_index, chunk_size):
+    """Yield the raw values of one CSV column, chunk by chunk"""
+    columns = pd.read_csv(file_path, nrows=0).columns
+    _check_column(column_index, len(columns))
+    
+    # Only parse the selected column, keeping values as text
+    reader = pd.read_csv(file_path, usecols=[column_index], dtype=str, chunksize=chunk_size)
+    with reader:
+        for chunk in reader:
+            yield from chunk.iloc[:, 0].tolist()
+
+def _iter_xlsx_column(file_path, column_index):
+    """Yield the raw values of one worksheet column using openpyxl's read-only mode"""
+    from openpyxl import load_workbook
     
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
     try:
-        if file_ext in ['.xlsx', '.xls']:
-            df = pd.read_excel(file_path)
-        elif file_ext == '.csv':
-            df = pd.read_csv(file_path)
-        else:
-            raise ValueError("Unsupported file format")
-        
-        # Adjust column index (0-based)
-        if column_index >= len(df.columns):
-            raise ValueError(f"Column index {column_index} out of range. File has {len(df.columns)} columns.")
+        sheet = workbook.worksheets[0]
+        column_count = sheet.max_column
+        if not column_count:
+            column_count = len(next(sheet.iter_rows(max_row=1, values_only=True), ()))
+        _check_column(column_index, column_count)
         
-        # Get data from specified column
-        data = df.iloc[:, column_index].astype(str)
-        
-        # Filter out blank/NA values
-        data = data[data.notna() & (data.str.strip() != '')]
-        
-        # Limit to max_rows if specified
-        if max_rows and max_rows > 0:
-            data = data.head(max_rows)
-        
-        return data.tolist()
+        # The first row holds the headers, like pandas
+        for (value,) in sheet.iter_rows(min_row=2, min_col=column_index + 1,
+                                        max_col=column_index + 1, values_only=True):
+            yield value
+    finally:
+        workbook.close()
+
+def _iter_xls_column(file_path, column_index):
+    """Yield the raw values of one column of a legacy .xls workbook"""
+    # xlrd has no streaming mode, but .xls sheets are capped at 65536 rows
+    df = pd.read_excel(file_path, dtype=str)
+    _check_column(column_index, len(df.columns))
+    yield from df.iloc[:, column_index].tolist()
+
+def iter_file_data(file_path, column_index, max_rows=None, chunk_size=10000):
+    """
+    Stream the non-blank values of one column from an uploaded file
+    
+    Only the selected column is parsed, CSV files are read in chunks of
+    chunk_size rows and .xlsx files through openpyxl's read-only mode, so
+    memory use does not grow with the file size. Reading stops as soon as
+    max_rows values have been produced.
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
     
+    if file_ext == '.xlsx':
+        values = _iter_xlsx_column(file_path, column_index)
+    elif file_ext == '.xls':
+        values = _iter_xls_column(file_path, column_index)
+    elif file_ext == '.csv':
+        values = _iter_csv_column(file_path, column_index, chunk_size)
+    else:
+        raise ValueError("Unsupported file format")
+    
+    data = _clean_values(values)
+    
+    # Limit to max_rows if specified
+    if max_rows and max_rows > 0:
+        data = itertools.islice(data, max_rows)
+    
+    try:
+        yield from data
     except Exception as e:
         logger.error(f"Error reading file {file_path}: {str(e)}")
         raise
+    finally:
+        values.close()
+
+def read_file_data(file_path, column_index, max_rows=None):
+    """Read data from uploaded file based on file type"""
+    return list(iter_file_data(file_path, column_index, max_rows))
+
+class _ZipStream(io.RawIOBase):
+    """Write-only, unseekable buffer that zipfile writes a streamed archive into"""
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_zip(entries, compression=zipfile.ZIP_STORED):
+    """
+    Build a ZIP archive on the fly from (name, data) pairs
+    
+    Yields the archive bytes as each entry is added, so a response can start
+    before the last entry exists. Entries are stored uncompressed by default
+    since PNGs are already compressed.
+    """
+    buffer = _ZipStream()
+    with zipfile.ZipFile(buffer, 'w', compression) as zipf:
+        for name, data in entries:
+            zipf.writestr(name, data)
+            yield buffer.drain()
+    
+    # Central directory
+    yield buffer.drain()
 
 def cleanup_old_files(directory, max_age_seconds):
     """Remove old files and directories"""
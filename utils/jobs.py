@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import uuid
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+def _job_executor(max_workers):
+    """Thread pool for the jobs, made of native threads even under gevent
+
+    gunicorn's gevent workers monkey-patch threading, which turns the
+    threads of a regular ThreadPoolExecutor into greenlets: a CPU-bound job
+    would then block the worker serving requests until it finishes.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        monkey = None
+
+    if monkey is not None and monkey.is_module_patched('threading'):
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='qr-job')
+
+class JobManager:
+    """
+    Run bulk generation jobs outside the request and track their progress
+
+    Job state is mirrored to a JSON file in the job directory so the status
+    can be served by any worker process, not only the one running the job.
+    Jobs run in native threads, also in gevent workers (see _job_executor).
+    """
+
+    def __init__(self, max_workers=2, write_interval=0.5):
+        self.executor = _job_executor(max_workers)
+        self.write_interval = write_interval
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _state_file(job_dir, job_id):
+        return os.path.join(job_dir, f"job_{job_id}.json")
+
+    def _write(self, job_id, force=False):
+        """Persist the job state, throttled unless force is set"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            now = time.time()
+            if not force and now - job['last_write'] < self.write_interval:
+                return
+            job['last_write'] = now
+            state = dict(job['state'], progress=dict(job['state']['progress']))
+
+        state_file = self._state_file(job['dir'], job_id)
+        tmp_file = state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, state_file)
+
+    def submit(self, job_dir, func, *args, **kwargs):
+        """
+        Queue func(*args, progress=..., **kwargs) and return the job id
+
+        func receives a progress callable taking counters as keyword arguments
+        (e.g. rows_encoded=100). Its return value becomes the job result.
+        """
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {
+                'dir': job_dir,
+                'last_write': 0,
+                'state': {
+                    'job_id': job_id,
+                    'status': 'queued',
+                    'progress': {},
+                    'result': None,
+                    'error': None,
+                    'created': time.time()
+                }
+            }
+        self._write(job_id, force=True)
+        self.executor.submit(self._run, job_id, func, args, kwargs)
+        logger.info(f"Job {job_id} queued")
+        return job_id
+
+    def update(self, job_id, **counters):
+        """Record progress counters for a running job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            job['state']['progress'].update(counters)
+        self._write(job_id)
+
+    def _finish(self, job_id, **state):
+        with self.lock:
+            self.jobs[job_id]['state'].update(state)
+        self._write(job_id, force=True)
+
+    def _run(self, job_id, func, args, kwargs):
+        start_time = time.time()
+        self._finish(job_id, status='running')
+        try:
+            result = func(*args, progress=lambda **counters: self.update(job_id, **counters), **kwargs)
+            self._finish(job_id, status='done', result=result, duration=time.time() - start_time)
+            logger.info(f"Job {job_id} finished in {time.time() - start_time:.1f}s")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self._finish(job_id, status='failed', error=str(e), duration=time.time() - start_time)
+        finally:
+            # Finished jobs are only kept on disk
+            with self.lock:
+                self.jobs.pop(job_id, None)
+
+    def get(self, job_dir, job_id):
+        """Return the current state of a job, or None if it is unknown"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return dict(job['state'], progress=dict(job['state']['progress']))
+
+        try:
+            with open(self._state_file(job_dir, job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
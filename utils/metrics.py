@@ -0,0 +1,192 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HELP = {
+    'qr_stage_seconds': 'Time spent in each stage of QR code generation',
+    'qr_requests_total': 'Generation requests by type',
+    'qr_codes_generated_total': 'QR codes generated by type',
+    'qr_symbols_encoded_total': 'Spreadsheet rows by the kind of QR symbol of their code',
+}
+
+class Histogram:
+    """Fixed-bucket histogram of observed durations"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+class MetricsRegistry:
+    """
+    In-process counters and timing histograms
+
+    Values are aggregated per process; each gunicorn worker reports its own.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.sessions = {}
+            self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter"""
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a duration in a histogram"""
+        key = (name, _label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the enclosed block into a histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed_iter(self, iterable, name, **labels):
+        """Pass items through, recording the total time spent producing them"""
+        elapsed = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe(name, elapsed, **labels)
+
+    def mark_active(self, session_id):
+        """Remember that a session used the app just now"""
+        with self.lock:
+            self.sessions[session_id] = time.time()
+
+    def active_sessions(self, window_seconds):
+        """Count sessions seen within the window, forgetting older ones"""
+        cutoff = time.time() - window_seconds
+        with self.lock:
+            self.sessions = {sid: seen for sid, seen in self.sessions.items() if seen >= cutoff}
+            return len(self.sessions)
+
+    def counter_values(self, name, label):
+        """Return {label value: count} for one counter"""
+        with self.lock:
+            return {dict(labels).get(label): value
+                    for (counter, labels), value in self.counters.items() if counter == name}
+
+    def snapshot(self):
+        """Return all histograms as nested dictionaries for JSON output"""
+        with self.lock:
+            histograms = {}
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                label = ",".join(f"{key}={value}" for key, value in labels) or 'all'
+                histograms.setdefault(name, {})[label] = histogram.snapshot()
+            return {'uptime_seconds': round(time.time() - self.started, 1), 'histograms': histograms}
+
+    def render_prometheus(self, gauges=None):
+        """Render all metrics in the Prometheus text exposition format
+
+        gauges is an optional {name: value} mapping of extra values (e.g.
+        cache statistics) exported as gauges.
+        """
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, {'le': bound})} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        for name, value in sorted((gauges or {}).items()):
+            if value is None:
+                continue
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+# Registry shared by the app, the pipeline and the background jobs
+metrics = MetricsRegistry()
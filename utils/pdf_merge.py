@@ -0,0 +1,222 @@
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Font resource added to the pages numbered while merging
+PAGE_NUMBER_FONT = '/FPageNumber'
+
+# Distinct images and forms remembered for reuse by the pages of later
+# inputs; an XObject seen again after dropping out is written again
+SHARED_XOBJECTS = 20000
+
+class PdfStreamWriter:
+    """
+    Write the pages of several PDFs into one file as they are read
+
+    Every object is written out as soon as its references are renumbered,
+    so only the object offsets and page numbers stay in memory, not the
+    pages. Objects shared by the pages of one input (fonts, forms) are
+    written once per input. Images and forms are also shared across
+    inputs: one with the same content as an XObject already written (by
+    a digest of its data and of everything it refers to) points at that
+    object instead, so parts rendered separately embed a code repeated
+    in several of them once, like a PDF laid out in one go. Needs pypdf
+    to parse the inputs.
+    """
+
+    def __init__(self, output_pdf):
+        self.file = open(output_pdf, 'wb')
+        self.offsets = [None]  # Byte offset of each object, by object number
+        self.pages = []
+        # (page index, object number, x) of the page number streams to write
+        self.numbered = []
+        self.pages_ref = self._reserve()
+        self.font_ref = None
+        # Object number of each XObject written, by content digest
+        self.xobjects = OrderedDict()
+        self.digests = {}
+        self.inputs = 0
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def _reserve(self):
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def _ref(self, number):
+        """Reference to an output object; these are left alone by _renumber"""
+        from pypdf.generic import IndirectObject
+
+        return IndirectObject(number, 0, self)
+
+    def _write_object(self, number, data):
+        self.offsets[number] = self.file.tell()
+        self.file.write(f"{number} 0 obj\n".encode('ascii'))
+        if isinstance(data, bytes):
+            self.file.write(data)
+        else:
+            data.write_to_stream(self.file)
+        self.file.write(b"\nendobj\n")
+
+    def _renumber(self, obj, numbers, pending):
+        """Point the references inside obj at output object numbers, in place"""
+        from pypdf.generic import IndirectObject, DictionaryObject, ArrayObject
+
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is self:
+                return obj
+            number = numbers.get(obj.idnum)
+            if number is None:
+                target = obj.get_object()
+                digest = self._digest(obj, visiting=frozenset()) if _is_xobject(target) else None
+                if digest in self.xobjects:
+                    self.xobjects.move_to_end(digest)
+                    number = numbers[obj.idnum] = self.xobjects[digest]
+                    return self._ref(number)
+                number = numbers[obj.idnum] = self._reserve()
+                if digest is not None:
+                    self.xobjects[digest] = number
+                    if len(self.xobjects) > SHARED_XOBJECTS:
+                        self.xobjects.popitem(last=False)
+                pending.append((number, target))
+            return self._ref(number)
+        if isinstance(obj, DictionaryObject):
+            for key, value in list(obj.items()):
+                obj[key] = self._renumber(value, numbers, pending)
+        elif isinstance(obj, ArrayObject):
+            for i, value in enumerate(obj):
+                obj[i] = self._renumber(value, numbers, pending)
+        return obj
+
+    def _digest(self, obj, visiting):
+        """Digest of obj and of the objects it refers to, equal for equal content"""
+        from pypdf.generic import IndirectObject, DictionaryObject, ArrayObject, StreamObject
+
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is self:
+                # Already copied, the output object stands for its content
+                return b'output %d' % obj.idnum
+            if obj.idnum in visiting:
+                # Only reached through a reference cycle, which never
+                # matches an object of another input
+                return b'cycle %d %d' % (self.inputs, obj.idnum)
+            # Every XObject is digested before it is renumbered in place
+            if obj.idnum not in self.digests:
+                self.digests[obj.idnum] = self._digest(obj.get_object(), visiting | {obj.idnum})
+            return self.digests[obj.idnum]
+
+        h = hashlib.blake2b(type(obj).__name__.encode('ascii'), digest_size=16)
+        if isinstance(obj, DictionaryObject):
+            for key in sorted(obj):
+                h.update(key.encode('utf-8'))
+                h.update(self._digest(obj.raw_get(key), visiting))
+            if isinstance(obj, StreamObject):
+                h.update(obj._data)
+        elif isinstance(obj, ArrayObject):
+            for value in obj:
+                h.update(self._digest(value, visiting))
+        else:
+            h.update(repr(obj).encode('utf-8'))
+        return h.digest()
+
+    def append(self, input_pdf, number_pages=False):
+        """Copy every page of input_pdf, numbering them in close() if number_pages"""
+        from pypdf import PdfReader
+        from pypdf.generic import NameObject
+
+        reader = PdfReader(input_pdf)
+        self.inputs += 1
+        # Digests of the objects of this input, by object number
+        self.digests = {}
+        numbers = {}
+        for page in reader.pages:
+            number = self._reserve()
+            # Only the page is copied, not the page tree of the input
+            page[NameObject('/Parent')] = self._ref(self.pages_ref)
+            if number_pages:
+                self._add_page_number(page)
+            pending = []
+            self._write_object(number, self._renumber(page, numbers, pending))
+            while pending:
+                child_number, child = pending.pop()
+                self._write_object(child_number, self._renumber(child, numbers, pending))
+            self.pages.append(number)
+
+    def _add_page_number(self, page):
+        """Add a content stream for the page number, written once the page count is known"""
+        from pypdf.generic import ArrayObject, DictionaryObject, NameObject
+
+        if self.font_ref is None:
+            self.font_ref = self._reserve()
+            self._write_object(self.font_ref, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+                                              b"/Encoding /WinAnsiEncoding >>")
+
+        # Resources can be shared by several pages, so each page gets a copy
+        resources = DictionaryObject(page['/Resources'] if '/Resources' in page else {})
+        fonts = DictionaryObject(resources['/Font'] if '/Font' in resources else {})
+        fonts[NameObject(PAGE_NUMBER_FONT)] = self._ref(self.font_ref)
+        resources[NameObject('/Font')] = fonts
+        page[NameObject('/Resources')] = resources
+
+        if '/Contents' not in page:
+            contents = []
+        elif isinstance(page['/Contents'], ArrayObject):
+            contents = list(page['/Contents'])
+        else:
+            contents = [page.raw_get('/Contents')]
+        # Drawn first, like create_qr_pdf does, so codes overlapping the
+        # number stay on top
+        stream_ref = self._reserve()
+        page[NameObject('/Contents')] = ArrayObject([self._ref(stream_ref)] + contents)
+        self.numbered.append((len(self.pages), stream_ref, float(page.mediabox.width) - 50))
+
+    def close(self):
+        """Write the page numbers, the page tree and the cross-reference table"""
+        total = len(self.pages)
+        for index, number, x in self.numbered:
+            # Same placement and font as the numbers drawn by create_qr_pdf
+            text = (f"q BT {PAGE_NUMBER_FONT} 8 Tf 0 g 1 0 0 1 {x:.4f} 20 Tm "
+                    f"(Page {index + 1}/{total}) Tj ET Q\n").encode('ascii')
+            self._write_object(number, b"<< /Length %d >>\nstream\n%s\nendstream" % (len(text), text))
+
+        kids = " ".join(f"{number} 0 R" for number in self.pages)
+        self._write_object(self.pages_ref, f"<< /Type /Pages /Kids [ {kids} ] "
+                                           f"/Count {total} >>".encode('ascii'))
+        catalog = self._reserve()
+        self._write_object(catalog, f"<< /Type /Catalog /Pages {self.pages_ref} 0 R >>".encode('ascii'))
+
+        xref = self.file.tell()
+        lines = [f"xref\n0 {len(self.offsets)}\n", "0000000000 65535 f \n"]
+        lines += [f"{offset:010d} 00000 n \n" for offset in self.offsets[1:]]
+        lines.append(f"trailer\n<< /Size {len(self.offsets)} /Root {catalog} 0 R >>\n"
+                     f"startxref\n{xref}\n%%EOF\n")
+        self.file.write("".join(lines).encode('ascii'))
+        self.file.close()
+
+def _is_xobject(obj):
+    from pypdf.generic import StreamObject
+
+    return isinstance(obj, StreamObject) and obj.get('/Subtype') in ('/Image', '/Form')
+
+def merge_pdfs(part_paths, output_pdf, number_pages=False):
+    """
+    Concatenate part PDFs in order into output_pdf (needs pypdf)
+
+    Pages are streamed to the output one at a time, so memory does not
+    grow with the document. With number_pages every page gets a
+    "Page N/Total" label, for parts laid out before the total was known.
+    """
+    with PdfStreamWriter(output_pdf) as writer:
+        for part_path in part_paths:
+            writer.append(part_path, number_pages)
+    logger.info(f"Merged {len(part_paths)} PDF parts into {len(writer.pages)} pages")
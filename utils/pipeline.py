@@ -0,0 +1,412 @@
+import os
+import json
+import math
+import time
+import hashlib
+import itertools
+import logging
+from array import array
+import numpy as np
+from utils.qr_generator import (iter_qr_codes, create_qr_pdf_parts, create_qr_zip, merge_pdfs, merge_zips,
+                                write_qr_images, render_image, svg_sheet_header, svg_sheet_rows,
+                                qr_per_page, zip_compression, ZipEntryNames, DEFAULT_PAGE_LAYOUT,
+                                PDF_PAGES_PER_PART, SVG_SHEET_FOOTER)
+from utils.checkpoint import Checkpoint, job_fingerprint
+from utils.file_utils import iter_file_data, stream_zip
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Report encoding progress every this many rows
+PROGRESS_INTERVAL = 100
+
+# Describes how to rebuild the ZIP while it is being downloaded
+ZIP_MANIFEST = 'qr_codes.zip.json'
+
+# Combined sheet of every code of a job, written when options['svg_sheet'] is set
+SVG_SHEET = 'qr_codes_sheet.svg'
+
+# Options that change the generated files; a checkpoint is only resumed
+# by a job whose upload and options all match
+CHECKPOINT_OPTIONS = ('column_index', 'max_rows', 'qr_size', 'page_margin', 'qr_margin',
+                      'include_text', 'include_page_numbers', 'error_level',
+                      'download_type', 'pdf_render', 'style', 'stream_zip', 'stream_zip_max_rows',
+                      'zip_path', 'image_dir', 'image_format', 'svg_sheet', 'sheet_path',
+                      'shared_masks', 'page_layout')
+
+def _count_rows(qr_codes, progress, start=0):
+    """Pass generated codes through while reporting how many were encoded"""
+    count = start
+    for item in qr_codes:
+        count += 1
+        if count % PROGRESS_INTERVAL == 0:
+            progress(rows_encoded=count)
+        yield item
+    progress(rows_encoded=count)
+
+def count_codes(data):
+    """
+    Return the number of rows and of distinct values in data
+
+    Values are not kept: distinct values are counted by a 64-bit hash of
+    each row, so memory grows with the rows, 8 MB per million.
+    """
+    hashes = array('Q')
+    for code in data:
+        digest = hashlib.blake2b(str(code).strip().encode('utf-8'), digest_size=8).digest()
+        hashes.append(int.from_bytes(digest, 'little'))
+    return len(hashes), len(np.unique(np.frombuffer(hashes, dtype=np.uint64)))
+
+def entry_names(data, image_format='png'):
+    """ZipEntryNames holding the values of rows already written, e.g. before a resumed row"""
+    names = ZipEntryNames(image_format)
+    for code in data:
+        names.add(str(code).strip())
+    return names
+
+def _timed(iterable, timings, stage):
+    """Pass items through, adding the time spent producing them to timings[stage]"""
+    timings.setdefault(stage, 0.0)
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[stage] += time.perf_counter() - start
+        yield item
+
+def _record_timings(timings):
+    """Report stage timings to the metrics registry"""
+    # Rows are read lazily while encoding, keep the two stages apart
+    if 'encode' in timings:
+        timings['encode'] -= timings.get('parse', 0.0)
+    for stage, seconds in timings.items():
+        metrics.observe('qr_stage_seconds', seconds, stage=stage, type='excel')
+
+def run_bulk_generation(file_path, session_dir, options, progress=None):
+    """
+    Generate QR codes for a spreadsheet column and build the requested outputs
+
+    Progress is checkpointed in session_dir after every batch of pages, so
+    running the job again for the same upload and options after a crash
+    resumes where it stopped.
+
+    Args:
+        file_path: Path of the uploaded Excel/CSV file
+        session_dir: Directory where the output files are written
+        options: Dictionary of generation parameters (see app.handle_excel_generation).
+            pdf_path/zip_path/sheet_path override where the outputs are
+            written and image_dir also saves every code to that directory,
+            in image_format ('png', 'svg' or 'eps'). With stream_zip the
+            ZIP is only described by a manifest for stream_zip_download,
+            unless the upload has more than stream_zip_max_rows rows.
+        progress: Optional callable receiving progress counters as keyword arguments
+
+    Returns:
+        Dictionary with the generation stats, the paths of the created files
+        and the time spent in each stage
+    """
+    timings = {}
+    try:
+        result = _run_bulk_generation(file_path, session_dir, options, progress, timings)
+    finally:
+        _record_timings(timings)
+    result['timings'] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    metrics.inc('qr_codes_generated_total', result['stats']['total_qr_codes'], type='excel')
+    for symbol in ('micro', 'standard'):
+        if f'{symbol}_qr_codes' in result['stats']:
+            metrics.inc('qr_symbols_encoded_total', result['stats'][f'{symbol}_qr_codes'], symbol=symbol)
+    return result
+
+def _run_bulk_generation(file_path, session_dir, options, progress, timings):
+    progress = progress or (lambda **counters: None)
+    download_type = options.get('download_type', 'pdf')
+    qr_size = options['qr_size']
+    style = options.get('style', 'standard')
+
+    # Stream data from file
+    data = _timed(iter_file_data(file_path, options.get('column_index', 0), options.get('max_rows')),
+                  timings, 'parse')
+
+    first = next(data, None)
+    if first is None:
+        raise ValueError('No valid data found in the specified column')
+    data = itertools.chain([first], data)
+
+    build_pdf = download_type in ['pdf', 'both']
+    build_zip = download_type in ['zip', 'both']
+    image_dir = options.get('image_dir')
+    build_sheet = options.get('svg_sheet', False)
+    image_format = options.get('image_format', 'png')
+    manifest_path = os.path.join(session_dir, ZIP_MANIFEST)
+    result = {}
+
+    if build_zip and options.get('stream_zip'):
+        # Only small jobs are streamed, every download encodes them again
+        limit = options.get('stream_zip_max_rows')
+        if limit is not None:
+            head = list(itertools.islice(data, limit + 1))
+            data = itertools.chain(head, data)
+            options = dict(options, stream_zip=len(head) <= limit)
+
+    if build_zip and options.get('stream_zip'):
+        # The archive is encoded on the fly when it is downloaded
+        with open(manifest_path, 'w') as f:
+            json.dump({
+                'file_path': file_path,
+                'column_index': options.get('column_index', 0),
+                'max_rows': options.get('max_rows'),
+                'qr_size': qr_size,
+                'error_level': options.get('error_level', 'l'),
+                'style': style,
+                'image_format': image_format,
+                'shared_masks': options.get('shared_masks', False)
+            }, f)
+        result['zip_manifest'] = manifest_path
+        build_zip = False
+    elif os.path.exists(manifest_path):
+        # Do not let a previous job's manifest shadow the new archive
+        os.remove(manifest_path)
+
+    if not build_pdf and not build_zip and not image_dir and not build_sheet:
+        total_rows, unique_rows = count_codes(data)
+        result['stats'] = {'total_qr_codes': total_rows, 'unique_qr_codes': unique_rows}
+        return result
+
+    page_margin = options.get('page_margin', 5)
+    qr_margin = options.get('qr_margin', 0)
+    per_page = qr_per_page(qr_size, page_margin, qr_margin, options.get('page_layout', DEFAULT_PAGE_LAYOUT))
+    pdf_path = options.get('pdf_path') or os.path.join(session_dir, 'qr_codes.pdf')
+    zip_path = options.get('zip_path') or os.path.join(session_dir, 'qr_codes.zip')
+    sheet_path = (options.get('sheet_path') or os.path.join(session_dir, SVG_SHEET)) if build_sheet else None
+
+    with Checkpoint(session_dir, job_fingerprint(file_path, options, CHECKPOINT_OPTIONS)) as checkpoint:
+        state = checkpoint.state
+        if 'total_rows' not in state:
+            # Page numbers need the row count before the first page is laid out
+            total_rows, unique_rows = count_codes(data)
+            checkpoint.save(total_rows=total_rows, unique_rows=unique_rows)
+        # Keep the initial scan apart from the parsing done while encoding
+        timings['count'] = timings.pop('parse')
+        total_pages = math.ceil(state['total_rows'] / per_page)
+        rows_done = state['rows_done']
+
+        if sheet_path:
+            if rows_done:
+                with open(sheet_path, 'r+b') as f:
+                    f.truncate(state['sheet_bytes'])
+            else:
+                with open(sheet_path, 'w') as f:
+                    f.write(svg_sheet_header(state['total_rows'], qr_size, page_margin, qr_margin,
+                                             options.get('include_text', False),
+                                             options.get('page_layout', DEFAULT_PAGE_LAYOUT)))
+                state['sheet_bytes'] = os.path.getsize(sheet_path)
+
+        # Read the file again, skipping the rows that are already written
+        data = _timed(iter_file_data(file_path, options.get('column_index', 0), options.get('max_rows')),
+                      timings, 'parse')
+        # Images of the rows written before name their values first
+        names = entry_names(itertools.islice(data, rows_done), image_format)
+
+        # Counted over the whole job, a resumed job continues the counts
+        symbols = state.setdefault('symbols', {'micro': 0, 'standard': 0})
+        for rows_done, pdf_parts, zip_part in write_batches(data, session_dir, checkpoint.parts_dir,
+                                                            rows_done, total_pages, options, sheet_path,
+                                                            progress, timings, symbols, names):
+            state['pdf_parts'] += [os.path.basename(path) for path in pdf_parts]
+            if zip_part:
+                state['zip_parts'].append(os.path.basename(zip_part))
+            if sheet_path:
+                state['sheet_bytes'] = os.path.getsize(sheet_path)
+            checkpoint.save(rows_done=rows_done)
+
+        result['stats'] = {
+            'total_qr_codes': state['total_rows'],
+            'unique_qr_codes': state['unique_rows'],
+            'micro_qr_codes': symbols['micro'],
+            'standard_qr_codes': symbols['standard']
+        }
+
+        # Create output files based on download type
+        if build_pdf:
+            start = time.perf_counter()
+            merge_pdfs([os.path.join(checkpoint.parts_dir, name) for name in state['pdf_parts']], pdf_path)
+            timings['pdf_layout'] = timings.get('pdf_layout', 0.0) + time.perf_counter() - start
+            result['pdf_path'] = pdf_path
+            result['stats'] = dict(qr_per_page=per_page, total_pages=total_pages, **result['stats'])
+
+        if build_zip:
+            start = time.perf_counter()
+            merge_zips([os.path.join(checkpoint.parts_dir, name) for name in state['zip_parts']], zip_path)
+            timings['zip_pack'] = timings.get('zip_pack', 0.0) + time.perf_counter() - start
+            result['zip_path'] = zip_path
+
+        if image_dir:
+            result['image_dir'] = image_dir
+
+        if sheet_path:
+            with open(sheet_path, 'a') as f:
+                f.write(SVG_SHEET_FOOTER)
+            result['sheet_path'] = sheet_path
+
+        if checkpoint.resumed_from:
+            result['stats']['resumed_from_row'] = checkpoint.resumed_from
+
+        checkpoint.clear()
+
+    return result
+
+def write_batches(data, work_dir, parts_dir, first_row, total_pages, options, sheet_path=None,
+                  progress=None, timings=None, symbols=None, names=None):
+    """
+    Encode rows and write them out batch by batch
+
+    data holds the rows of the job starting at row first_row, in a document
+    of total_pages pages. Each batch covers whole PDF pages: they are laid
+    out as part PDFs in parts_dir, the codes are packed into a part ZIP
+    there and saved to options['image_dir'] as requested by the options,
+    and their elements are appended to the SVG sheet at sheet_path if
+    given. Yields (rows_done, pdf_parts, zip_part) after every batch so
+    callers can record how far the job got; a batch's part files are
+    complete once it is yielded, merge_pdfs and merge_zips join them. The
+    rows with Micro QR and standard QR codes are counted in symbols (see
+    iter_qr_codes). names is the ZipEntryNames of
+    the rows before first_row (see entry_names), so the images of values
+    seen there are not written again and names stay unique across runs.
+    """
+    progress = progress or (lambda **counters: None)
+    timings = {} if timings is None else timings
+    download_type = options.get('download_type', 'pdf')
+    build_pdf = download_type in ['pdf', 'both']
+    # A streamed ZIP is built while it is downloaded instead
+    build_zip = download_type in ['zip', 'both'] and not options.get('stream_zip')
+    image_dir = options.get('image_dir')
+    qr_size = options['qr_size']
+    style = options.get('style', 'standard')
+    page_margin = options.get('page_margin', 5)
+    qr_margin = options.get('qr_margin', 0)
+    per_page = qr_per_page(qr_size, page_margin, qr_margin, options.get('page_layout', DEFAULT_PAGE_LAYOUT))
+    workers = options.get('workers') or os.cpu_count() or 1
+    image_format = options.get('image_format', 'png')
+    vector_images = image_format != 'png' or sheet_path
+
+    if vector_images and style != 'standard':
+        raise ValueError('SVG and EPS output is only available for the standard style')
+
+    # Vector PDFs only need the module matrices, PNGs are rendered for
+    # the ZIP while packing. Styled codes are always drawn as images.
+    # SVG/EPS images are written from the matrices too, which also
+    # makes the PDF vector.
+    if (options.get('pdf_render') == 'vector' and build_pdf or vector_images) and style == 'standard':
+        output = 'matrix'
+    elif options.get('in_memory', True):
+        output = 'bytes'
+    else:
+        output = 'file'
+
+    if image_dir:
+        os.makedirs(image_dir, exist_ok=True)
+
+    # The ZIP and the image directory name each value the same way
+    if names is None:
+        names = ZipEntryNames(image_format)
+    zip_names, image_names = names, names.copy()
+
+    # Generate QR codes
+    qr_codes = _count_rows(_timed(iter_qr_codes(
+        data, work_dir, qr_size, options.get('error_level', 'l'),
+        workers=workers,
+        chunk_size=options.get('chunk_size'),
+        output=output,
+        style=style,
+        shared_masks=options.get('shared_masks', False),
+        symbols=symbols
+    ), timings, 'encode'), progress, start=first_row)
+
+    rows_done = first_row
+    # Batches end on page boundaries so every batch becomes whole PDF parts
+    for batch in _batches(qr_codes, per_page * PDF_PAGES_PER_PART * workers):
+        first_page = rows_done // per_page
+        pdf_parts = []
+        zip_part = None
+        if build_pdf:
+            start = time.perf_counter()
+            pdf_parts = create_qr_pdf_parts(
+                batch, parts_dir, first_page, total_pages,
+                qr_size, page_margin, qr_margin,
+                options.get('include_text', False), options.get('include_page_numbers', False),
+                progress=lambda page, total_pages: progress(pages_written=page, total_pages=total_pages),
+                workers=workers,
+                page_layout=options.get('page_layout', DEFAULT_PAGE_LAYOUT)
+            )
+            timings['pdf_layout'] = timings.get('pdf_layout', 0.0) + time.perf_counter() - start
+
+        if build_zip:
+            # Each batch gets its own archive: appending to one ZIP would
+            # overwrite its central directory, and a crash meanwhile would
+            # lose every entry written before
+            start = time.perf_counter()
+            zip_part = create_qr_zip(batch, os.path.join(parts_dir, f"part_{first_page:06d}.zip"), qr_size,
+                                     image_format=image_format, names=zip_names)
+            timings['zip_pack'] = timings.get('zip_pack', 0.0) + time.perf_counter() - start
+
+        if image_dir:
+            start = time.perf_counter()
+            write_qr_images(batch, image_dir, qr_size, image_format, names=image_names)
+            timings['image_write'] = timings.get('image_write', 0.0) + time.perf_counter() - start
+
+        if sheet_path:
+            start = time.perf_counter()
+            with open(sheet_path, 'a') as f:
+                f.write(svg_sheet_rows(batch, rows_done, qr_size, page_margin, qr_margin,
+                                       options.get('include_text', False),
+                                       options.get('page_layout', DEFAULT_PAGE_LAYOUT)))
+            timings['svg_sheet'] = timings.get('svg_sheet', 0.0) + time.perf_counter() - start
+
+        rows_done += len(batch)
+        yield rows_done, pdf_parts, zip_part
+
+def _batches(items, size):
+    """Split an iterable into lists of up to size items"""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _zip_entries(qr_codes, names, image_format, scale):
+    """(name, data) of each value's image, named like create_qr_zip's entries"""
+    for qr_file, code in qr_codes:
+        name = names.add(code)
+        if name is not None:
+            yield name, render_image(qr_file, image_format, scale)
+
+def stream_zip_download(session_dir, workers=None, chunk_size=None):
+    """
+    Stream qr_codes.zip for a session from its manifest
+
+    Returns a generator of archive bytes, or None if the session has no
+    manifest (i.e. the ZIP was written to disk by the job).
+    """
+    manifest_path = os.path.join(session_dir, ZIP_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    image_format = manifest.get('image_format', 'png')
+    scale = max(1, int(manifest['qr_size'] / 25))
+    data = iter_file_data(manifest['file_path'], manifest['column_index'], manifest['max_rows'])
+    qr_codes = iter_qr_codes(data, session_dir, manifest['qr_size'], manifest['error_level'],
+                             workers=workers, chunk_size=chunk_size,
+                             output='bytes' if image_format == 'png' else 'matrix',
+                             style=manifest.get('style', 'standard'),
+                             shared_masks=manifest.get('shared_masks', False))
+    entries = _zip_entries(qr_codes, ZipEntryNames(image_format), image_format, scale)
+    return metrics.timed_iter(stream_zip(entries, zip_compression(image_format)),
+                              'qr_stage_seconds', stage='zip_stream', type='excel')
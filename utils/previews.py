@@ -0,0 +1,96 @@
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# How rendered single codes reach their file in the session folder
+PERSISTENCE_MODES = ('lazy', 'background')
+
+class PreviewStore:
+    """
+    Single codes rendered for a preview, kept in memory until saved
+
+    The preview and the download come from the same rendered bytes. With
+    mode 'lazy' the file is only written when it is downloaded (persist),
+    which needs the download to reach the same server process. With
+    'background' a writer thread saves it right after the request, for
+    servers running several processes. Entries beyond max_bytes are
+    written out by the writer thread, oldest first, so no code is lost.
+    """
+
+    def __init__(self, mode='background', max_bytes=64 * 1024 * 1024):
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview-writer')
+        self.entries = {}  # Insertion ordered, oldest first
+        self.memory_bytes = 0
+        self.configure(mode, max_bytes)
+
+    def configure(self, mode='background', max_bytes=64 * 1024 * 1024):
+        """(Re)configure the store, writing out anything still pending"""
+        if mode not in PERSISTENCE_MODES:
+            raise ValueError(f'Unknown preview persistence mode: {mode}')
+        self.flush()
+        with self.lock:
+            self.mode = mode
+            self.max_bytes = max_bytes
+
+    def save(self, path, data):
+        """Keep data to be written to path; never touches the disk itself"""
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.memory_bytes -= len(old)
+            self.entries[path] = data
+            self.memory_bytes += len(data)
+            over_budget = self.memory_bytes > self.max_bytes
+
+        if self.mode == 'background':
+            self.writer.submit(self.persist, path)
+        elif over_budget:
+            self.writer.submit(self._trim)
+
+    def persist(self, path):
+        """Write the pending bytes for path, if any, to the file; False if that failed"""
+        with self.lock:
+            data = self.entries.get(path)
+        if data is None:
+            return True
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name so a download never sees half a file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not save QR code {path}: {str(e)}")
+            return False
+
+        with self.lock:
+            # Unless a newer rendering replaced it in the meantime
+            if self.entries.get(path) is data:
+                del self.entries[path]
+                self.memory_bytes -= len(data)
+        return True
+
+    def _trim(self):
+        """Write out the oldest entries until the store is back under max_bytes"""
+        while True:
+            with self.lock:
+                if self.memory_bytes <= self.max_bytes or not self.entries:
+                    return
+                path = next(iter(self.entries))
+            if not self.persist(path):
+                return
+
+    def flush(self):
+        """Write every pending entry"""
+        with self.lock:
+            paths = list(self.entries)
+        for path in paths:
+            self.persist(path)
+
+preview_store = PreviewStore()
@@ -0,0 +1,177 @@
+import os
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class QRRenderCache:
+    """
+    Content-addressed cache for rendered QR codes
+
+    Rendered output is stored by a hash of everything that affects it. The
+    first tier is an in-process LRU bounded by item count and total bytes;
+    the optional second tier is a directory shared by all processes, trimmed
+    back under max_disk_bytes by evicting the least recently used files.
+    """
+
+    def __init__(self, max_items=10000, max_bytes=32 * 1024 * 1024,
+                 disk_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        self.lock = threading.Lock()
+        self.configure(max_items, max_bytes, disk_dir, max_disk_bytes)
+
+    def configure(self, max_items=10000, max_bytes=32 * 1024 * 1024,
+                  disk_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        """(Re)configure the cache limits, dropping anything cached so far"""
+        with self.lock:
+            self.max_items = max_items
+            self.max_bytes = max_bytes
+            self.disk_dir = disk_dir
+            self.max_disk_bytes = max_disk_bytes
+            self.entries = OrderedDict()
+            self.memory_bytes = 0
+            self.disk_bytes = None  # Measured lazily on first disk write
+            self.counters = {'hits': 0, 'misses': 0, 'memory_hits': 0,
+                             'disk_hits': 0, 'evictions': 0, 'disk_evictions': 0}
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(data, error_level, micro, scale, border, style):
+        """Build the cache key for a rendered code"""
+        raw = "\x00".join(str(part) for part in (data, error_level, micro, scale, border, style))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def get(self, key):
+        """Return the cached bytes for key, or None"""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                self.counters['memory_hits'] += 1
+                return value
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    value = f.read()
+                os.utime(path)  # Mark as recently used for eviction
+            except OSError:
+                value = None
+
+            if value is not None:
+                with self.lock:
+                    self.counters['hits'] += 1
+                    self.counters['disk_hits'] += 1
+                self._remember(key, value)
+                return value
+
+        with self.lock:
+            self.counters['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        """Store rendered bytes under key in every enabled tier"""
+        self._remember(key, value)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                return
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(value)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not write QR cache entry: {str(e)}")
+                return
+
+            with self.lock:
+                if self.disk_bytes is not None:
+                    self.disk_bytes += len(value)
+            self._trim_disk()
+
+    def _remember(self, key, value):
+        """Add an entry to the in-memory LRU, evicting the oldest entries"""
+        if len(value) > self.max_bytes:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.memory_bytes -= len(old)
+            self.entries[key] = value
+            self.memory_bytes += len(value)
+
+            while len(self.entries) > self.max_items or self.memory_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+                self.counters['evictions'] += 1
+
+    def _scan_disk(self):
+        """Return (mtime, size, path) for every file in the disk tier"""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _trim_disk(self):
+        """Evict least recently used files once the disk tier is over its limit"""
+        with self.lock:
+            if self.disk_bytes is not None and self.disk_bytes <= self.max_disk_bytes:
+                return
+
+        files = self._scan_disk()
+        total = sum(size for _, size, _ in files)
+
+        if total > self.max_disk_bytes:
+            # Trim to 90% of the limit so we do not rescan on every write
+            target = self.max_disk_bytes * 0.9
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                with self.lock:
+                    self.counters['disk_evictions'] += 1
+
+        with self.lock:
+            self.disk_bytes = total
+
+    def add_counters(self, counters):
+        """Add hit/miss counters of lookups made by another process's cache"""
+        with self.lock:
+            for name, value in counters.items():
+                self.counters[name] += value
+
+    def stats(self):
+        """Return hit/miss counters and current usage for monitoring"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats['items'] = len(self.entries)
+            stats['memory_bytes'] = self.memory_bytes
+            stats['disk_bytes'] = self.disk_bytes
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+# Cache shared by the generators in this process, configured by the app
+render_cache = QRRenderCache()
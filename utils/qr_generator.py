@@ -1,45 +1,791 @@
 import segno
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageColor
+import io
 import os
+import html
+import hashlib
+import shutil
+import logging
+import tempfile
+import zipfile
+import zlib
+import struct
 import math
-import colorsys
+import functools
+import multiprocessing
+import numpy as np
+import itertools
+from collections import deque, Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from utils.qr_cache import render_cache
+from utils.pdf_merge import merge_pdfs
 
-def generate_qr_codes(data, output_dir, qr_size, error_level='l'):
+logger = logging.getLogger(__name__)
+
+# Number of rows handed to a worker process in a single task
+DEFAULT_CHUNK_SIZE = 250
+
+# Quiet zone (in modules) around codes generated in bulk
+BULK_BORDER = 1
+
+# Distinct values whose output is kept for reuse while a bulk job runs
+DEDUPE_ITEMS = 20000
+
+# Pages rendered per worker task when a PDF is built in parallel
+PDF_PAGES_PER_PART = 20
+
+# Styles that are fast enough to render for every code of a bulk job
+BULK_STYLES = ('standard', 'rounded')
+
+# Smallest module, in pixels, that rounded corners are drawn at; smaller
+# modules (e.g. bulk codes of 50 points, 2 pixels per module) are drawn
+# this large and scaled down with anti-aliased corners
+ROUNDED_MIN_SCALE = 8
+
+# zlib level and strategy of the 1-bit PNGs written by matrix_to_png; see
+# benchmarks/bench_png.py for the size and speed of the other levels
+PNG_COMPRESS_LEVEL = 9
+PNG_STRATEGY = zlib.Z_FILTERED
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Smallest code size (in points) that scans reliably when printed
+MIN_QR_SIZE = 50
+
+# Units of the label dimensions below, in points
+INCH = 72
+MM = INCH / 25.4
+
+# Paper sizes the PDF can be laid out on as a uniform grid of codes
+PAGE_SIZES = ('a4', 'letter')
+DEFAULT_PAGE_LAYOUT = 'a4'
+
+# Label stock with one code per label: paper size, columns and rows of
+# labels, label size, offset of the first label from the top-left corner
+# of the page and distance between neighbouring labels, in points
+LABEL_PRESETS = {
+    'avery-5160': {'page_size': 'letter', 'cols': 3, 'rows': 10,
+                   'label_width': 2.625 * INCH, 'label_height': 1 * INCH,
+                   'left': 0.1875 * INCH, 'top': 0.5 * INCH,
+                   'h_pitch': 2.75 * INCH, 'v_pitch': 1 * INCH},
+    'avery-5163': {'page_size': 'letter', 'cols': 2, 'rows': 5,
+                   'label_width': 4 * INCH, 'label_height': 2 * INCH,
+                   'left': 0.15625 * INCH, 'top': 0.5 * INCH,
+                   'h_pitch': 4.1875 * INCH, 'v_pitch': 2 * INCH},
+    'avery-22806': {'page_size': 'letter', 'cols': 3, 'rows': 4,
+                    'label_width': 2 * INCH, 'label_height': 2 * INCH,
+                    'left': 0.625 * INCH, 'top': 0.625 * INCH,
+                    'h_pitch': 2.625 * INCH, 'v_pitch': 31 / 12 * INCH},
+    'avery-l7160': {'page_size': 'a4', 'cols': 3, 'rows': 7,
+                    'label_width': 63.5 * MM, 'label_height': 38.1 * MM,
+                    'left': 7.21 * MM, 'top': 15.15 * MM,
+                    'h_pitch': 66.04 * MM, 'v_pitch': 38.1 * MM},
+    'avery-l7163': {'page_size': 'a4', 'cols': 2, 'rows': 7,
+                    'label_width': 99.1 * MM, 'label_height': 38.1 * MM,
+                    'left': 4.65 * MM, 'top': 15.15 * MM,
+                    'h_pitch': 101.6 * MM, 'v_pitch': 38.1 * MM}
+}
+
+# Everything the PDF can be laid out on: plain paper or label stock
+PAGE_LAYOUTS = PAGE_SIZES + tuple(LABEL_PRESETS)
+
+# Space kept free around a code on a label, against printer misalignment
+LABEL_PADDING = 6
+
+# Height reserved under a code for its text label
+LABEL_TEXT_HEIGHT = 10
+
+# File formats of the individual images of a bulk job; SVG and EPS are
+# written straight from the module matrix without rasterizing
+IMAGE_FORMATS = ('png', 'svg', 'eps')
+
+# Characters of the QR numeric and alphanumeric modes
+_NUMERIC_CHARS = frozenset('0123456789')
+_ALPHANUMERIC_CHARS = frozenset('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:')
+
+# A value of each mode, repeated to a profile's length
+_PROFILE_SAMPLES = {'numeric': '0', 'alphanumeric': 'A', 'byte': 'a'}
+
+def data_profile(code):
+    """Return the (mode, length) of an ASCII value, or None for other values
+    
+    All values with the same profile need the same number of data bits, so
+    they end up with the same symbol version and error correction level.
+    """
+    if not code or not code.isascii():
+        return None
+    chars = set(code)
+    if chars <= _NUMERIC_CHARS:
+        return 'numeric', len(code)
+    if chars <= _ALPHANUMERIC_CHARS:
+        return 'alphanumeric', len(code)
+    return 'byte', len(code)
+
+# Characters of each mode that fit a Micro QR symbol, by version and error
+# level (ISO/IEC 18004 table 7). Levels are listed from lowest to highest.
+# M1 only detects errors and only holds digits, byte mode starts at M3.
+MICRO_CAPACITY = {
+    'M1': {None: {'numeric': 5}},
+    'M2': {'l': {'numeric': 10, 'alphanumeric': 6},
+           'm': {'numeric': 8, 'alphanumeric': 5}},
+    'M3': {'l': {'numeric': 23, 'alphanumeric': 14, 'byte': 9},
+           'm': {'numeric': 18, 'alphanumeric': 11, 'byte': 7}},
+    'M4': {'l': {'numeric': 35, 'alphanumeric': 21, 'byte': 15},
+           'm': {'numeric': 30, 'alphanumeric': 18, 'byte': 13},
+           'q': {'numeric': 21, 'alphanumeric': 13, 'byte': 9}}
+}
+
+# Longest value in characters of any mode (kanji: 9) that can be a Micro QR code
+MICRO_MAX_CHARS = 15
+
+def micro_symbol(mode, length):
+    """Return the (version, error level) segno.make_micro picks for a value, or None
+    
+    That is the smallest symbol holding the value, at the highest error
+    level it still fits in. None means the value needs a standard QR code.
+    """
+    for version, levels in MICRO_CAPACITY.items():
+        fitting = [error for error, capacity in levels.items() if length <= capacity.get(mode, -1)]
+        if fitting:
+            return version, fitting[-1]
+    return None
+
+@functools.lru_cache(maxsize=4096)
+def _profile_params(profile, error_level):
+    """Work out the segno.make arguments shared by every value of a profile
+    
+    Micro QR symbols come from the capacity table. Standard symbols are
+    searched for once per worker process on a sample value; the mask is the
+    one segno picks for the sample, so it only depends on the profile.
+    """
+    mode, length = profile
+    micro = micro_symbol(mode, length)
+    if micro:
+        version, error = micro
+        qr = segno.make(_PROFILE_SAMPLES[mode] * length, error=error, version=version,
+                        mode=mode, micro=True, boost_error=False)
+    else:
+        qr = segno.make(_PROFILE_SAMPLES[mode] * length, error=error_level, mode=mode, micro=False)
+    # M1 symbols only detect errors and have no level
+    error = qr.error.lower() if qr.error else None
+    return {'version': qr.version, 'error': error, 'mode': qr.mode,
+            'micro': qr.is_micro, 'mask': qr.mask, 'boost_error': False}
+
+def make_bulk_qr(code, error_level, shared_masks=False):
+    """Encode one value of a bulk job, as a Micro QR code if it fits
+    
+    Values whose profile was seen before skip the version search, which
+    on its own saves little: scoring the eight masks is most of the work.
+    With shared_masks they also reuse the mask picked for a sample value
+    of the profile, which encodes two to four times faster. Any mask
+    decodes the same, but the code no longer gets the mask with the fewest
+    scanner-confusing patterns for its own value (ISO/IEC 18004 8.8), so
+    this is opt-in.
+    """
+    profile = data_profile(code)
+    if profile is None:
+        # Non-ASCII values may use the byte or kanji mode, only short ones
+        # can be Micro QR codes
+        if len(code) <= MICRO_MAX_CHARS:
+            try:
+                return segno.make_micro(code, error=None)
+            except ValueError:
+                pass
+        return segno.make(code, error=error_level, micro=False)
+    
+    params = _profile_params(profile, error_level)
+    if not shared_masks:
+        params = dict(params, mask=None)
+    return segno.make(code, **params)
+
+def _encode_chunk(task):
+    """Encode one chunk of codes; runs inside a worker process
+    
+    Returns the PNG bytes in the style given by kind (or the module matrix
+    when kind is 'matrix') of every code in the chunk, in order.
+    """
+    codes, qr_size, error_level, kind, shared_masks = task
+    results = []
+    
+    # Calculate scale to achieve the desired size
+    scale = max(1, int(qr_size / 25))
+    
+    for clean_code in codes:
+        qr = make_bulk_qr(clean_code, error_level, shared_masks)
+        
+        if kind == 'matrix':
+            # Only keep the module matrix, rendering is left to the writers
+            results.append(tuple(bytes(row) for row in qr.matrix))
+            continue
+        
+        # Keep the PNG in memory, the parent process decides where it goes
+        if kind == 'rounded':
+            buffer = io.BytesIO()
+            _render_rounded(qr, scale, BULK_BORDER).save(buffer, format='PNG')
+            results.append(buffer.getvalue())
+        else:
+            results.append(matrix_to_png(qr.matrix, scale, BULK_BORDER))
+    
+    return results
+
+def _symbol_width(payload, scale):
+    """Width in modules of the symbol of a matrix or PNG payload"""
+    if _is_matrix(payload):
+        return len(payload)
+    # The image width is the first field of the PNG's IHDR chunk
+    return struct.unpack('>I', payload[16:20])[0] // scale - 2 * BULK_BORDER
+
+# Micro QR symbols are 11 to 17 modules wide, standard ones 21 or more
+MICRO_MAX_WIDTH = 17
+
+def _process_pool(max_workers):
+    """Pool of worker processes, also started from native threads under gevent
+    
+    gevent's monkey-patched os.fork only works in the thread running the
+    main event loop, while bulk jobs run in native threads of their own
+    (see utils.jobs). Their workers are forked from a fork server instead,
+    which has this module imported already.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        monkey = None
+    
+    if monkey is not None and monkey.is_module_patched('os'):
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+def _iter_chunks(data, chunk_size):
+    """Split any iterable into (start_index, codes) chunks"""
+    iterator = iter(data)
+    start = 0
+    while True:
+        codes = list(itertools.islice(iterator, chunk_size))
+        if not codes:
+            return
+        yield start, codes
+        start += len(codes)
+
+def _pack_matrix(matrix):
+    return b"".join(matrix)
+
+def _unpack_matrix(value):
+    size = math.isqrt(len(value))
+    return tuple(value[i:i + size] for i in range(0, len(value), size))
+
+class _Chunk:
+    """A chunk of rows on its way through the encoder, with its cache lookups"""
+    
+    def __init__(self, start, codes, qr_size, error_level, kind, cache, seen=None, shared_masks=False):
+        self.start = start
+        self.codes = [str(code).strip() for code in codes]
+        self.payloads = [None] * len(self.codes)
+        self.keys = {}
+        self.cache = cache
+        
+        # Codes already encoded earlier in the job are output as they were
+        # then (with output='file', the path of their file), see finish
+        self.reused = {}
+        if seen:
+            for j, code in enumerate(self.codes):
+                if code in seen:
+                    self.reused[j] = seen[code]
+        
+        self.kind = kind
+        self.missing = [j for j in range(len(self.codes)) if j not in self.reused]
+        # Every distinct value is looked up and encoded once per chunk
+        self.todo = list(dict.fromkeys(self.codes[j] for j in self.missing))
+        self.found = {}
+        
+        if cache is not None:
+            scale = max(1, int(qr_size / 25)) if kind != 'matrix' else None
+            for code in self.todo:
+                # Codes with their own best mask look different from shared-mask ones
+                micro = 'auto' if shared_masks else 'auto-best-mask'
+                key = self.keys[code] = cache.make_key(code, error_level, micro, scale, BULK_BORDER, kind)
+                value = cache.get(key)
+                if value is not None:
+                    self.found[code] = _unpack_matrix(value) if kind == 'matrix' else value
+            self.todo = [code for code in self.todo if code not in self.found]
+        
+        self.task = (self.todo, qr_size, error_level, kind, shared_masks)
+    
+    def complete(self, encoded):
+        """Fill in freshly encoded codes and store them in the cache"""
+        for code, payload in zip(self.todo, encoded):
+            self.found[code] = payload
+            if self.cache is not None:
+                value = _pack_matrix(payload) if self.kind == 'matrix' else payload
+                self.cache.put(self.keys[code], value)
+        for j in self.missing:
+            self.payloads[j] = self.found[self.codes[j]]
+        return self
+
+def iter_qr_codes(data, output_dir, qr_size, error_level='l',
+                  workers=None, chunk_size=DEFAULT_CHUNK_SIZE, output='file',
+                  cache=render_cache, style='standard', dedupe=True, shared_masks=False,
+                  symbols=None, dedupe_items=DEDUPE_ITEMS):
+    """Generate QR codes for each data item, yielding (qr_file, code) in input order
+    
+    Rows are encoded in chunks by a pool of worker processes. Only a bounded
+    number of chunks is in flight at a time so large inputs are not read
+    ahead of the consumer. Codes found in the render cache are not encoded
+    again; pass cache=None to always encode.
+    
+    With dedupe, every distinct value is encoded once and all of its rows
+    share the same qr_file object (and, with output='file', the same file),
+    so the writers can emit it once. Payloads of the dedupe_items most
+    recently seen values are kept; a value that comes back after being
+    dropped is encoded again, so memory does not grow with the input.
+    
+    With output='file' each code is written to output_dir as qr_{i}.png and
+    qr_file is its path. With output='bytes' nothing is written to disk and
+    qr_file holds the PNG bytes instead. With output='matrix' qr_file is the
+    module matrix (a tuple of rows, one byte per module) which create_qr_pdf
+    draws as vector graphics. style picks one of BULK_STYLES for PNG output.
+    shared_masks is passed on to make_bulk_qr.
+    
+    If symbols is a dict, its 'micro' and 'standard' counts are increased
+    for every row yielded, by the kind of symbol of its code, however the
+    code was obtained (encoded, from the cache or shared with an earlier
+    row). Rows that are read ahead but not yet yielded are not counted.
+    """
+    if output not in ('file', 'bytes', 'matrix'):
+        raise ValueError(f"Unsupported output mode: {output}")
+    if style not in BULK_STYLES:
+        raise ValueError(f"Unsupported style for bulk generation: {style}")
+    
+    kind = 'matrix' if output == 'matrix' else style
+    scale = max(1, int(qr_size / 25))
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, int(chunk_size or DEFAULT_CHUNK_SIZE))
+    # Distinct values mapped to (payload, is Micro QR)
+    seen = OrderedDict() if dedupe else None
+    chunks = (_Chunk(start, codes, qr_size, error_level, kind, cache, seen, shared_masks)
+              for start, codes in _iter_chunks(data, chunk_size))
+    
+    def finish(chunk):
+        for j, (payload, code) in enumerate(zip(chunk.payloads, chunk.codes)):
+            if seen is not None and code in seen:
+                # Chunks in flight together may both have encoded a value,
+                # the first one finished wins
+                seen.move_to_end(code)
+                payload, micro = seen[code]
+            else:
+                if j in chunk.reused:
+                    # Found when the chunk was read ahead, dropped from seen
+                    # since; its file is already written
+                    payload, micro = chunk.reused[j]
+                else:
+                    micro = _symbol_width(payload, scale) <= MICRO_MAX_WIDTH
+                    if output == 'file':
+                        # Save the QR code image
+                        qr_file = os.path.join(output_dir, f"qr_{chunk.start + j}.png")
+                        with open(qr_file, 'wb') as f:
+                            f.write(payload)
+                        payload = qr_file
+                if seen is not None:
+                    seen[code] = payload, micro
+                    if len(seen) > dedupe_items:
+                        seen.popitem(last=False)
+            
+            if symbols is not None:
+                symbol = 'micro' if micro else 'standard'
+                symbols[symbol] = symbols.get(symbol, 0) + 1
+            yield payload, code
+    
+    # Peek at the first two chunks: small jobs are not worth a process pool
+    head = list(itertools.islice(chunks, 2))
+    if workers <= 1 or len(head) < 2:
+        for chunk in itertools.chain(head, chunks):
+            yield from finish(chunk.complete(_encode_chunk(chunk.task)))
+        return
+    
+    chunks = itertools.chain(head, chunks)
+    with _process_pool(workers) as executor:
+        def submit(chunk):
+            # Chunks without anything left to encode never go to a worker
+            future = executor.submit(_encode_chunk, chunk.task) if chunk.todo else None
+            pending.append((chunk, future))
+        
+        pending = deque()
+        for chunk in itertools.islice(chunks, workers * 2):
+            submit(chunk)
+        
+        while pending:
+            # Results are consumed in submission order to keep output ordered
+            chunk, future = pending.popleft()
+            chunk.complete(future.result() if future else [])
+            for next_chunk in itertools.islice(chunks, 1):
+                submit(next_chunk)
+            yield from finish(chunk)
+
+def generate_qr_codes(data, output_dir, qr_size, error_level='l',
+                      workers=None, chunk_size=DEFAULT_CHUNK_SIZE, output='file',
+                      cache=render_cache, style='standard', dedupe=True, shared_masks=False):
     """Generate QR codes for each data item"""
-    qr_files = []
+    return list(iter_qr_codes(data, output_dir, qr_size, error_level,
+                              workers=workers, chunk_size=chunk_size, output=output,
+                              cache=cache, style=style, dedupe=dedupe, shared_masks=shared_masks))
+
+def _is_matrix(qr_file):
+    """Check whether a generated code is a module matrix rather than an image"""
+    return isinstance(qr_file, tuple)
+
+def _matrix_runs(matrix):
+    """Yield (x, y, length) for every horizontal run of dark modules"""
+    for y, row in enumerate(matrix):
+        x = 0
+        width = len(row)
+        while x < width:
+            if row[x]:
+                start = x
+                while x < width and row[x]:
+                    x += 1
+                yield start, y, x - start
+            else:
+                x += 1
+
+def _draw_matrix(c, matrix, x, y, size, border=BULK_BORDER):
+    """Draw a module matrix as filled vector rectangles at (x, y)"""
+    module_size = size / (len(matrix) + 2 * border)
+    
+    # Work in module units with the origin at the top-left module so every
+    # rectangle is written with small integer coordinates
+    ops = ["q", "%.4f 0 0 %.4f %.4f %.4f cm" % (
+        module_size, -module_size,
+        x + border * module_size, y + size - border * module_size
+    )]
+    
+    # Merge adjacent dark modules of a row into a single rectangle
+    ops.extend(f"{run_x} {run_y} {length} 1 re" for run_x, run_y, length in _matrix_runs(matrix))
+    ops.extend(("f", "Q"))
+    c.addLiteral("\n".join(ops))
+
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+def matrix_to_png(matrix, scale, border=BULK_BORDER, dark='#000', light='#fff',
+                  compress_level=PNG_COMPRESS_LEVEL, strategy=PNG_STRATEGY):
+    """Render a module matrix to a 1-bit PNG, pixel for pixel like segno's output
+    
+    Black and white codes are written as 1-bit greyscale, other colors as a
+    two-entry palette. Each module row is packed once; its repeats use the
+    "Up" filter, so they are all zeros and deflate to almost nothing.
+    """
+    modules = np.frombuffer(b"".join(matrix), dtype=np.uint8).reshape(len(matrix), -1)
+    # Bit 1 is the light color in both the greyscale and the palette image
+    pixels = np.pad(modules, border) == 0
+    width = pixels.shape[1] * scale
+    packed = np.packbits(np.repeat(pixels, scale, axis=1), axis=1)
+    
+    repeat_row = b'\x02' + bytes(packed.shape[1])
+    scanlines = []
+    for row in packed:
+        scanlines.append(b'\x00' + row.tobytes())
+        scanlines.extend([repeat_row] * (scale - 1))
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, 15, 9, strategy)
+    data = compressor.compress(b"".join(scanlines)) + compressor.flush()
     
-    for i, code in enumerate(data):
-        clean_code = str(code).strip()
+    dark, light = ImageColor.getrgb(dark), ImageColor.getrgb(light)
+    greyscale = (dark, light) == ((0, 0, 0), (255, 255, 255))
+    chunks = [_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, width, 1, 0 if greyscale else 3, 0, 0, 0))]
+    if not greyscale:
+        chunks.append(_png_chunk(b'PLTE', bytes(dark[:3] + light[:3])))
+    chunks.append(_png_chunk(b'IDAT', data))
+    chunks.append(_png_chunk(b'IEND', b''))
+    return PNG_SIGNATURE + b"".join(chunks)
+
+def _svg_path(matrix, border=BULK_BORDER):
+    """Path data drawing the dark modules as horizontal strokes one module wide"""
+    commands = []
+    last_y, end = None, 0
+    for x, y, length in _matrix_runs(matrix):
+        if y != last_y:
+            # Strokes run through the middle of the module row
+            commands.append(f"M{x + border} {y + border}.5h{length}")
+        else:
+            commands.append(f"m{x - end} 0h{length}")
+        last_y, end = y, x + length
+    return "".join(commands)
+
+def matrix_to_svg(matrix, scale, border=BULK_BORDER):
+    """Render a module matrix as a standalone SVG, as large as the PNG would be"""
+    width = len(matrix) + 2 * border
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width * scale}" height="{width * scale}" '
+            f'viewBox="0 0 {width} {width}" shape-rendering="crispEdges">'
+            f'<rect width="{width}" height="{width}" fill="#fff"/>'
+            f'<path stroke="#000" d="{_svg_path(matrix, border)}"/></svg>\n').encode('ascii')
+
+def matrix_to_eps(matrix, scale, border=BULK_BORDER):
+    """Render a module matrix as an EPS file, as large (in points) as the PNG in pixels"""
+    width = len(matrix) + 2 * border
+    lines = [
+        "%!PS-Adobe-3.0 EPSF-3.0",
+        f"%%BoundingBox: 0 0 {width * scale} {width * scale}",
+        "%%EndComments",
+        "gsave",
+        f"{scale} {scale} scale",
+        f"1 setgray 0 0 {width} {width} rectfill",
+        "0 setgray"
+    ]
+    # PostScript's y axis points up, module rows are counted from the top
+    lines.extend(f"{x + border} {width - border - y - 1} {length} 1 rectfill"
+                 for x, y, length in _matrix_runs(matrix))
+    lines.extend(("grestore", "%%EOF", ""))
+    return "\n".join(lines).encode('ascii')
+
+# Writers turning a module matrix into each of the IMAGE_FORMATS
+_MATRIX_WRITERS = {'png': matrix_to_png, 'svg': matrix_to_svg, 'eps': matrix_to_eps}
+
+def render_image(qr_file, image_format='png', scale=1):
+    """Return the file contents of one generated code in image_format
+    
+    Module matrices can be written in any of IMAGE_FORMATS; PNG payloads
+    (bytes or a file path) only as PNG.
+    """
+    if _is_matrix(qr_file):
+        return _MATRIX_WRITERS[image_format](qr_file, scale)
+    if image_format != 'png':
+        raise ValueError(f"{image_format.upper()} images can only be written from module matrices")
+    if isinstance(qr_file, bytes):
+        return qr_file
+    with open(qr_file, 'rb') as f:
+        return f.read()
+
+def _image_source(qr_file):
+    """Return something reportlab can draw: a file path or an in-memory PNG"""
+    from reportlab.lib.utils import ImageReader
+    
+    if isinstance(qr_file, bytes):
+        return ImageReader(io.BytesIO(qr_file))
+    return qr_file
+
+def zip_entry_name(code, extension='png'):
+    """Build a safe archive member name from the code value"""
+    # Use the code value as filename (sanitized)
+    safe_name = "".join([c if c.isalnum() else "_" for c in code])
+    safe_name = safe_name[:50]  # Limit filename length
+    return f"{safe_name}.{extension}"
+
+class ZipEntryNames:
+    """Names of the individual images of a job, one per distinct value
+    
+    Values are named by zip_entry_name in the order they are first seen.
+    Distinct values that come out as the same name, such as "A-1" and
+    "A_1" or long URLs sharing their first 50 characters, get a numbered
+    suffix (A_1_2.png, ...) instead of replacing each other. Only a digest
+    of each value is kept, but together with the names taken that is
+    about 220 bytes per distinct value: unlike the rest of a bulk job,
+    memory grows with the number of distinct values.
+    """
+    
+    def __init__(self, extension='png'):
+        self.extension = extension
+        self.values = set()
+        self.names = set()
+    
+    def add(self, code):
+        """Return the name for a value seen for the first time, None for a repeat"""
+        digest = hashlib.blake2b(code.encode('utf-8'), digest_size=16).digest()
+        if digest in self.values:
+            return None
+        self.values.add(digest)
         
-        # Try to create a Micro QR code first if possible
-        try:
-            qr = segno.make_micro(clean_code, error=None)
-        except ValueError:
-            # Fall back to standard QR with specified error correction
-            qr = segno.make(clean_code, error=error_level)
+        name = zip_entry_name(code, self.extension)
+        if name in self.names:
+            stem = name[:-len(self.extension) - 1]
+            suffix = 2
+            while f"{stem}_{suffix}.{self.extension}" in self.names:
+                suffix += 1
+            name = f"{stem}_{suffix}.{self.extension}"
+        self.names.add(name)
+        return name
+    
+    def copy(self):
+        names = ZipEntryNames(self.extension)
+        names.values = set(self.values)
+        names.names = set(self.names)
+        return names
+
+def zip_compression(image_format):
+    """PNGs are already compressed, SVG and EPS text is deflated"""
+    return zipfile.ZIP_STORED if image_format == 'png' else zipfile.ZIP_DEFLATED
+
+def create_qr_zip(qr_files, output_zip, qr_size=None, mode='w', image_format='png', names=None):
+    """Create a ZIP file with the individual QR code images, one per distinct value
+    
+    qr_size is only needed when qr_files holds module matrices, which are
+    rendered to image_format while packing. With mode='a' the codes are
+    added to an existing archive. names (a ZipEntryNames) names the
+    entries; pass the same one to every call adding to an archive so
+    values already in it are skipped. Without it, names the archive
+    already holds are not reused.
+    """
+    scale = max(1, int(qr_size / 25)) if qr_size else 1
+    
+    with zipfile.ZipFile(output_zip, mode) as zipf:
+        if names is None:
+            names = ZipEntryNames(image_format)
+            names.names.update(zipf.namelist())
+        for qr_file, code in qr_files:
+            # Repeated values would only overwrite each other when extracted
+            name = names.add(code)
+            if name is None:
+                continue
+            
+            if isinstance(qr_file, str) and image_format == 'png':
+                zipf.write(qr_file, name)
+            else:
+                zipf.writestr(name, render_image(qr_file, image_format, scale),
+                              compress_type=zip_compression(image_format))
+    
+    return output_zip
+
+def merge_zips(part_paths, output_zip):
+    """Copy the entries of part ZIPs, in order, into a single archive
+    
+    The parts are expected to be written with a shared ZipEntryNames (see
+    create_qr_zip), so every value is in one part under a unique name.
+    """
+    with zipfile.ZipFile(output_zip, 'w') as zip_out:
+        for part_path in part_paths:
+            with zipfile.ZipFile(part_path) as zip_in:
+                for info in zip_in.infolist():
+                    zip_out.writestr(info, zip_in.read(info))
+    
+    return output_zip
+
+def write_qr_images(qr_files, output_dir, qr_size=None, image_format='png', names=None):
+    """Save the individual QR code images to output_dir, named like the ZIP entries
+    
+    names (a ZipEntryNames) carries the values already saved over from
+    earlier calls for the same directory.
+    """
+    scale = max(1, int(qr_size / 25)) if qr_size else 1
+    if names is None:
+        names = ZipEntryNames(image_format)
+    
+    for qr_file, code in qr_files:
+        name = names.add(code)
+        if name is None:
+            continue
         
-        # Save the QR code image
-        qr_file = os.path.join(output_dir, f"qr_{i}.png")
+        with open(os.path.join(output_dir, name), 'wb') as f:
+            f.write(render_image(qr_file, image_format, scale))
+    
+    return output_dir
+
+def _sheet_grid(layout):
+    """(column x positions, top of the first row, row pitch) of a sheet in SVG coordinates"""
+    slots = layout['slots']
+    # PDF slots are measured from the bottom of the page, SVG from the top
+    top = layout['height'] - slots[0][1] - layout['qr_size']
+    return [x for x, _ in slots[:layout['cols']]], top, layout['row_pitch']
+
+def svg_sheet_header(total_rows, qr_size, page_margin, qr_margin, include_text=False,
+                     page_layout=DEFAULT_PAGE_LAYOUT):
+    """Opening of a combined SVG sheet with room for total_rows codes
+    
+    The sheet is one tall page as wide as the paper of page_layout, using
+    the same columns and row spacing as the PDF. It is written as this
+    header, the fragments of svg_sheet_rows and SVG_SHEET_FOOTER, so it
+    can be built batch by batch.
+    """
+    layout = _pdf_layout(qr_size, page_margin, qr_margin, include_text, page_layout)
+    _, top, row_pitch = _sheet_grid(layout)
+    grid_rows = math.ceil(total_rows / layout['cols'])
+    width = layout['width']
+    height = 2 * top + (grid_rows - 1) * row_pitch + layout['qr_size']
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{width:g}pt" height="{height:g}pt" viewBox="0 0 {width:g} {height:g}">\n'
+            f'<rect width="100%" height="100%" fill="#fff"/>\n')
+
+SVG_SHEET_FOOTER = '</svg>\n'
+
+def svg_sheet_rows(qr_files, first_row, qr_size, page_margin, qr_margin, include_text=False,
+                   page_layout=DEFAULT_PAGE_LAYOUT, border=BULK_BORDER):
+    """SVG elements placing module matrices on the sheet, starting at row first_row of the job"""
+    layout = _pdf_layout(qr_size, page_margin, qr_margin, include_text, page_layout)
+    cols = layout['cols']
+    # Codes on label stock are drawn at the size that fits the labels
+    qr_size = layout['qr_size']
+    columns, top, row_pitch = _sheet_grid(layout)
+    elements = []
+    ids = {}
+    
+    for i, (matrix, code) in enumerate(qr_files, first_row):
+        row, col = divmod(i, cols)
+        x = columns[col]
+        y = top + row * row_pitch
         
-        # Calculate scale to achieve the desired size
-        scale = max(1, int(qr_size / 25))
+        # Codes shared by several rows are defined once and referenced
+        ref = ids.get(id(matrix))
+        if ref is None:
+            ref = ids[id(matrix)] = f"q{i}"
+            elements.append(f'<defs><path id="{ref}" stroke="#000" d="{_svg_path(matrix, border)}"/></defs>')
         
-        # Save with specified border
-        qr.save(qr_file, scale=scale, border=1)
+        module_size = qr_size / (len(matrix) + 2 * border)
+        elements.append(f'<use xlink:href="#{ref}" transform="translate({x:.4f} {y:.4f}) scale({module_size:.4f})"/>')
         
-        qr_files.append((qr_file, clean_code))
+        if include_text:
+            # Truncate long codes for display, like the PDF labels
+            display_text = code[:15] + "..." if len(code) > 15 else code
+            elements.append(f'<text x="{x + qr_size / 2:.4f}" y="{y + qr_size + 10:.4f}" font-family="Helvetica" '
+                            f'font-size="6" text-anchor="middle">{html.escape(display_text)}</text>')
     
-    return qr_files
+    return "\n".join(elements) + "\n" if elements else ""
 
-def create_qr_pdf(qr_files, output_pdf, qr_size, page_margin, qr_margin, 
-                  include_text=False, include_page_numbers=False):
-    """Create PDF with QR codes based on user preferences"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
+def qr_per_page(qr_size, page_margin, qr_margin, page_layout=DEFAULT_PAGE_LAYOUT):
+    """Number of QR codes create_qr_pdf places on each page"""
+    layout = _pdf_layout(qr_size, page_margin, qr_margin, page_layout=page_layout)
+    return layout['cols'] * layout['rows']
+
+def fit_qr_size(min_size, page_margin, qr_margin, include_text=False, page_layout=DEFAULT_PAGE_LAYOUT):
+    """Largest code size that fits as many codes per page as min_size does
     
-    # PDF page setup with A4 size
-    c = canvas.Canvas(output_pdf, pagesize=A4)
-    width, height = A4  # A4 is 595.2 x 841.8 points
+    The grid is sized for the most codes of at least min_size on a page,
+    then the codes grow into the space left over (keeping room for text
+    labels). Codes on label stock already fill their labels, so min_size
+    is returned unchanged for LABEL_PRESETS.
+    """
+    if page_layout in LABEL_PRESETS:
+        return min_size
+    layout = _pdf_layout(min_size, page_margin, qr_margin, page_layout=page_layout)
+    cols, rows = layout['cols'], layout['rows']
+    text_height = LABEL_TEXT_HEIGHT if include_text else 0
+    
+    # Keep the spacing between codes wide enough for their borders and
+    # the text under them
+    size = min((layout['width'] - 2 * page_margin - (cols + 1) * 2 * qr_margin) / cols,
+               (layout['height'] - 2 * page_margin - (rows + 1) * (2 * qr_margin + text_height)) / rows)
+    return max(min_size, math.floor(size))
+
+# Font and size of the code labels under each QR code in the PDF
+LABEL_FONT = "Helvetica"
+LABEL_FONT_SIZE = 6
+
+@functools.lru_cache(maxsize=64)
+def _pdf_layout(qr_size, page_margin, qr_margin, include_text=False, page_layout=DEFAULT_PAGE_LAYOUT):
+    """Compute the grid used to place the QR codes on a page of page_layout
+    
+    The result is cached, so jobs with the same settings share it. 'slots'
+    holds the (x, y) of every code on a page in drawing order and, with
+    include_text, 'labels' the (center x, y) of the text under each one.
+    'qr_size' is the size the codes are drawn at and 'row_pitch' the
+    distance between rows. Raises ValueError if no code fits on the page.
+    """
+    from reportlab.lib.pagesizes import A4, LETTER
+    
+    if page_layout in LABEL_PRESETS:
+        return _label_layout(LABEL_PRESETS[page_layout], qr_margin, include_text)
+    if page_layout not in PAGE_SIZES:
+        raise ValueError(f'Unknown page layout: {page_layout}')
+    
+    # A4 is 595.2 x 841.8 points, Letter 612 x 792
+    pagesize = A4 if page_layout == 'a4' else LETTER
+    width, height = pagesize
     
     # Calculate effective area for QR codes
     effective_width = width - 2 * page_margin
@@ -51,17 +797,128 @@ def create_qr_pdf(qr_files, output_pdf, qr_size, page_margin, qr_margin,
     # Calculate how many QR codes can fit per row and column
     cols = math.floor(effective_width / qr_with_spacing)
     rows = math.floor(effective_height / qr_with_spacing)
+    if cols < 1 or rows < 1:
+        raise ValueError(f'QR codes of {qr_size} points do not fit on {page_layout.upper()} paper '
+                         f'with these margins')
     
     # Calculate spacing to distribute QR codes evenly
     h_spacing = (effective_width - (cols * qr_size)) / (cols + 1)
     v_spacing = (effective_height - (rows * qr_size)) / (rows + 1)
     
-    # Calculate total pages needed
-    total_pages = math.ceil(len(qr_files) / (cols * rows))
+    # Position of each code, row by row from the top of the page
+    slots = tuple(
+        (page_margin + h_spacing + col * (qr_size + h_spacing),
+         height - (page_margin + v_spacing + (row + 1) * qr_size + row * v_spacing))
+        for row in range(rows) for col in range(cols)
+    )
+    
+    return {
+        'pagesize': pagesize,
+        'width': width,
+        'height': height,
+        'cols': cols,
+        'rows': rows,
+        'h_spacing': h_spacing,
+        'v_spacing': v_spacing,
+        'row_pitch': qr_size + v_spacing,
+        'qr_size': qr_size,
+        'slots': slots,
+        'labels': _label_positions(slots, qr_size) if include_text else ()
+    }
+
+def _label_layout(preset, qr_margin, include_text):
+    """Place one code in the middle of every label of a LABEL_PRESETS entry
+    
+    Codes are as large as the labels allow, keeping qr_margin (at least
+    LABEL_PADDING) free around them and room for the text under them.
+    """
+    from reportlab.lib.pagesizes import A4, LETTER
+    
+    pagesize = A4 if preset['page_size'] == 'a4' else LETTER
+    width, height = pagesize
+    label_width, label_height = preset['label_width'], preset['label_height']
+    padding = max(qr_margin, LABEL_PADDING)
+    text_height = LABEL_TEXT_HEIGHT if include_text else 0
+    
+    qr_size = min(label_width, label_height - text_height) - 2 * padding
+    if qr_size < MIN_QR_SIZE:
+        raise ValueError(f'The labels are too small for a scannable QR code '
+                         f'({qr_size:.0f} points, at least {MIN_QR_SIZE} needed)')
+    
+    # Codes sit above the text, centred in the rest of the label
+    slots = tuple(
+        (preset['left'] + col * preset['h_pitch'] + (label_width - qr_size) / 2,
+         height - preset['top'] - row * preset['v_pitch'] - label_height
+         + text_height + (label_height - text_height - qr_size) / 2)
+        for row in range(preset['rows']) for col in range(preset['cols'])
+    )
+    
+    return {
+        'pagesize': pagesize,
+        'width': width,
+        'height': height,
+        'cols': preset['cols'],
+        'rows': preset['rows'],
+        'row_pitch': preset['v_pitch'],
+        'qr_size': qr_size,
+        'slots': slots,
+        'labels': _label_positions(slots, qr_size) if include_text else ()
+    }
+
+def _label_positions(slots, qr_size):
+    """(center x, baseline y) of the text label under each code"""
+    return tuple((x + qr_size / 2, y - LABEL_TEXT_HEIGHT) for x, y in slots)
+
+@functools.lru_cache(maxsize=None)
+def _label_char_widths():
+    """Width of each character of the label font, in 1/1000 of the font size"""
+    from reportlab.pdfbase.pdfmetrics import getFont
+    
+    font = getFont(LABEL_FONT)
+    widths = {}
+    for code, glyph in enumerate(font.encoding.vector):
+        try:
+            char = bytes([code]).decode('cp1252')
+        except UnicodeDecodeError:
+            continue
+        # Control characters are left to stringWidth, which maps them differently
+        if glyph and char.isprintable():
+            widths[char] = font.widths[code]
+    return widths
+
+def _label_widths(texts):
+    """Widths in points of several labels, as reportlab's stringWidth computes them"""
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    
+    char_widths = _label_char_widths()
+    widths = []
+    for text in texts:
+        try:
+            width = sum(map(char_widths.__getitem__, text)) * LABEL_FONT_SIZE / 1000
+        except KeyError:
+            # Characters missing from the font are drawn from fallback fonts
+            width = stringWidth(text, LABEL_FONT, LABEL_FONT_SIZE)
+        widths.append(width)
+    return widths
+
+def _draw_pdf_pages(c, qr_files, layout, first_page, total_pages, qr_size, page_margin,
+                    qr_margin, include_text, include_page_numbers, progress=None):
+    """Lay out qr_files on consecutive pages, starting at page number first_page"""
+    width = layout['width']
+    # Codes on label stock are drawn at the size that fits the labels
+    qr_size = layout['qr_size']
+    slots, labels = layout['slots'], layout['labels']
+    per_page = len(slots)
+    
+    # Payloads shared by several rows (see iter_qr_codes' dedupe)
+    occurrences = Counter(id(qr_file) for qr_file, _ in qr_files)
+    repeated = {key for key, count in occurrences.items() if count > 1}
+    forms = {}
     
     # Add QR codes to PDF
-    for page in range(total_pages):
-        if page > 0:
+    for page_offset in range(math.ceil(len(qr_files) / per_page)):
+        page = first_page + page_offset
+        if page_offset > 0:
             c.showPage()  # Start a new page
         
         # Add page number if requested
@@ -69,140 +926,310 @@ def create_qr_pdf(qr_files, output_pdf, qr_size, page_margin, qr_margin,
             c.setFont("Helvetica", 8)
             c.drawString(width - 50, 20, f"Page {page + 1}/{total_pages}")
         
-        # Calculate starting indices for this page
-        start_idx = page * cols * rows
-        end_idx = min(start_idx + cols * rows, len(qr_files))
+        page_files = qr_files[page_offset * per_page:(page_offset + 1) * per_page]
         
-        for i in range(start_idx, end_idx):
-            # Calculate position in the grid
-            idx_in_page = i - start_idx
-            row = idx_in_page // cols
-            col = idx_in_page % cols
-            
-            # Calculate x, y position
-            x = page_margin + h_spacing + col * (qr_size + h_spacing)
-            y = height - (page_margin + v_spacing + (row + 1) * qr_size + row * v_spacing)
-            
-            qr_file, code_text = qr_files[i]
-            
+        if include_text:
+            # Label widths for the whole page at once; the font is set once
+            # here as the states saved around forms leave it unchanged
+            texts = [code[:15] + "..." if len(code) > 15 else code for _, code in page_files]
+            text_widths = _label_widths(texts)
+            c.setFont(LABEL_FONT, LABEL_FONT_SIZE)
+        
+        for i, ((x, y), (qr_file, _)) in enumerate(zip(slots, page_files)):
             # Draw border rectangle if margin > 0
             if qr_margin > 0:
                 c.rect(x - qr_margin, y - qr_margin, 
                        qr_size + 2 * qr_margin, qr_size + 2 * qr_margin)
             
-            # Add QR code image
-            c.drawImage(qr_file, x, y, width=qr_size, height=qr_size)
+            # Repeated codes are drawn once as a form and referenced after that
+            if id(qr_file) in repeated:
+                name = forms.get(id(qr_file))
+                if name is None:
+                    name = forms[id(qr_file)] = f"qr{len(forms)}"
+                    c.beginForm(name, 0, 0, qr_size, qr_size)
+                    _draw_qr(c, qr_file, 0, 0, qr_size)
+                    c.endForm()
+                c.saveState()
+                c.translate(x, y)
+                c.doForm(name)
+                c.restoreState()
+            else:
+                _draw_qr(c, qr_file, x, y, qr_size)
             
-            # Add text label if requested
+            # Add text label if requested, truncated for display
             if include_text:
-                c.setFont("Helvetica", 6)
-                # Truncate long codes for display
-                display_text = code_text[:15] + "..." if len(code_text) > 15 else code_text
-                text_width = c.stringWidth(display_text, "Helvetica", 6)
-                c.drawString(x + (qr_size - text_width)/2, y - 10, display_text)
+                center, label_y = labels[i]
+                c.drawString(center - text_widths[i] / 2, label_y, texts[i])
+        
+        if progress:
+            progress(page + 1, total_pages)
+
+def _draw_qr(c, qr_file, x, y, size):
+    """Draw one code, either as vector modules or as an image"""
+    if _is_matrix(qr_file):
+        _draw_matrix(c, qr_file, x, y, size)
+    else:
+        # Rounded codes are drawn through their alpha channel
+        c.drawImage(_image_source(qr_file), x, y, width=size, height=size, mask='auto')
+
+def _render_pdf_part(task):
+    """Render a range of pages into a partial PDF; runs inside a worker process"""
+    from reportlab.pdfgen import canvas
     
-    # Save the PDF
+    qr_files, part_path, first_page, total_pages, page_layout, args = task
+    layout = _pdf_layout(*args[:4], page_layout=page_layout)
+    c = canvas.Canvas(part_path, pagesize=layout['pagesize'])
+    _draw_pdf_pages(c, qr_files, layout, first_page, total_pages, *args)
     c.save()
+    return part_path
+
+def create_qr_pdf(qr_files, output_pdf, qr_size, page_margin, qr_margin, 
+                  include_text=False, include_page_numbers=False, progress=None,
+                  workers=1, pages_per_part=PDF_PAGES_PER_PART, page_layout=DEFAULT_PAGE_LAYOUT):
+    """Create PDF with QR codes based on user preferences
     
-    return {
-        'qr_per_page': cols * rows,
+    progress, if given, is called as progress(pages_done, total_pages) after
+    each page has been laid out. Rows sharing the same qr_file object are
+    drawn once into a form XObject that every occurrence refers to.
+    
+    page_layout is one of PAGE_SIZES, for a grid of qr_size codes, or of
+    LABEL_PRESETS, for one code per label sized to fit it.
+    
+    With more than one worker (None means one per CPU), large documents are
+    split into ranges of pages_per_part pages that are rendered in separate
+    processes and then concatenated with merge_pdfs. The pages look the
+    same as with the serial path, but the file is laid out differently.
+    """
+    from reportlab.pdfgen import canvas
+    
+    layout = _pdf_layout(qr_size, page_margin, qr_margin, include_text, page_layout)
+    per_page = layout['cols'] * layout['rows']
+    args = (qr_size, page_margin, qr_margin, include_text, include_page_numbers)
+    
+    # Calculate total pages needed
+    total_pages = math.ceil(len(qr_files) / per_page)
+    
+    stats = {
+        'qr_per_page': per_page,
         'total_pages': total_pages,
         'total_qr_codes': len(qr_files)
     }
+    
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and total_pages > pages_per_part:
+        parts_dir = tempfile.mkdtemp(prefix='pdf_parts_', dir=os.path.dirname(os.path.abspath(output_pdf)))
+        try:
+            merge_pdfs(create_qr_pdf_parts(qr_files, parts_dir, 0, total_pages, *args,
+                                           progress=progress, workers=workers,
+                                           pages_per_part=pages_per_part, page_layout=page_layout),
+                       output_pdf)
+        finally:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+        return stats
+    
+    # PDF page setup with the paper size of the layout
+    c = canvas.Canvas(output_pdf, pagesize=layout['pagesize'])
+    _draw_pdf_pages(c, qr_files, layout, 0, total_pages, *args, progress=progress)
+    
+    # Save the PDF
+    c.save()
+    
+    return stats
+
+def stream_qr_pdf(qr_codes, output_pdf, qr_size, page_margin, qr_margin,
+                  include_text=False, include_page_numbers=False, total_pages=None,
+                  progress=None, pages_per_part=PDF_PAGES_PER_PART, page_layout=DEFAULT_PAGE_LAYOUT):
+    """Lay out an iterator of (qr_file, code) into a PDF as the codes arrive
+    
+    Only pages_per_part pages of codes are held at a time: each run of
+    pages is written to a part file that is streamed into output_pdf at the
+    end, so memory stays the same however many codes there are. Without
+    total_pages the "Page N/Total" labels are added while merging, once
+    the page count is known. progress, if given, is called as
+    progress(pages_done, total_pages) after each part.
+    """
+    layout = _pdf_layout(qr_size, page_margin, qr_margin, page_layout=page_layout)
+    per_page = layout['cols'] * layout['rows']
+    # Page numbers are only drawn with the parts if the total is known
+    args = (qr_size, page_margin, qr_margin, include_text,
+            include_page_numbers and total_pages is not None)
+    
+    parts_dir = tempfile.mkdtemp(prefix='pdf_parts_', dir=os.path.dirname(os.path.abspath(output_pdf)))
+    try:
+        part_paths = []
+        rows = 0
+        qr_codes = iter(qr_codes)
+        for batch in iter(lambda: list(itertools.islice(qr_codes, per_page * pages_per_part)), []):
+            page = rows // per_page
+            part_path = os.path.join(parts_dir, f"part_{page:06d}.pdf")
+            part_paths.append(_render_pdf_part((batch, part_path, page, total_pages, page_layout, args)))
+            rows += len(batch)
+            if progress:
+                progress(math.ceil(rows / per_page), total_pages)
+        merge_pdfs(part_paths, output_pdf, number_pages=include_page_numbers and total_pages is None)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    
+    return {
+        'qr_per_page': per_page,
+        'total_pages': math.ceil(rows / per_page),
+        'total_qr_codes': rows
+    }
 
-def create_styled_qr(data, output_file, size, error_level='m', style='standard'):
+def create_qr_pdf_parts(qr_files, parts_dir, first_page, total_pages, qr_size, page_margin,
+                        qr_margin, include_text=False, include_page_numbers=False,
+                        progress=None, workers=1, pages_per_part=PDF_PAGES_PER_PART,
+                        page_layout=DEFAULT_PAGE_LAYOUT):
+    """Lay out qr_files as part PDFs of up to pages_per_part pages each
+    
+    The first code goes on page first_page (counted from 0) of a document
+    with total_pages pages, so page numbers match the full document. Parts
+    are written to parts_dir as part_<first page>.pdf and rendered by a
+    pool of worker processes when there is more than one. Returns the part
+    paths in page order, ready for merge_pdfs. Each part embeds the codes
+    it draws; merge_pdfs keeps one copy of a code found in several parts.
+    """
+    layout = _pdf_layout(qr_size, page_margin, qr_margin, page_layout=page_layout)
+    per_page = layout['cols'] * layout['rows']
+    args = (qr_size, page_margin, qr_margin, include_text, include_page_numbers)
+    
+    tasks = []
+    for offset in range(0, math.ceil(len(qr_files) / per_page), pages_per_part):
+        part_files = qr_files[offset * per_page:(offset + pages_per_part) * per_page]
+        part_path = os.path.join(parts_dir, f"part_{first_page + offset:06d}.pdf")
+        tasks.append((part_files, part_path, first_page + offset, total_pages, page_layout, args))
+    
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        executor = _process_pool(min(workers, len(tasks)))
+        results = executor.map(_render_pdf_part, tasks)
+    else:
+        executor = None
+        results = map(_render_pdf_part, tasks)
+    
+    try:
+        part_paths = []
+        for task, part_path in zip(tasks, results):
+            part_paths.append(part_path)
+            if progress:
+                progress(min(task[2] + pages_per_part, total_pages), total_pages)
+    finally:
+        if executor:
+            executor.shutdown()
+    
+    return part_paths
+
+def _module_mask(qr, scale, border):
+    """Return a boolean pixel array of the QR code, True for dark pixels"""
+    size = len(qr.matrix)
+    modules = np.frombuffer(b"".join(bytes(row) for row in qr.matrix), dtype=np.uint8)
+    modules = np.pad(modules.reshape(size, size).astype(bool), border)
+    return modules.repeat(scale, axis=0).repeat(scale, axis=1)
+
+def _vertical_gradient(height, top, bottom):
+    """Return a (height, 4) array of RGBA colours blending top into bottom"""
+    position = np.arange(height)[:, None] / height
+    rgb = np.array(top) + (np.array(bottom) - np.array(top)) * position
+    alpha = np.full((height, 1), 255)
+    return np.hstack([rgb.astype(np.uint8), alpha]).astype(np.uint8)
+
+def _paint(mask, dark, light):
+    """Build an RGBA image from a pixel mask
+    
+    dark and light can be single RGBA colours or any array that broadcasts
+    against the (height, width, 4) image, e.g. per-row colours.
+    """
+    height, width = mask.shape
+    dark = np.broadcast_to(np.asarray(dark, dtype=np.uint8), (height, width, 4))
+    light = np.broadcast_to(np.asarray(light, dtype=np.uint8), (height, width, 4))
+    pixels = np.where(mask[:, :, None], dark, light)
+    return Image.fromarray(np.ascontiguousarray(pixels), 'RGBA')
+
+@functools.lru_cache(maxsize=64)
+def _rounded_stamp(scale):
+    """Return the coverage (0-255) of each pixel of a single rounded module
+    
+    Modules smaller than ROUNDED_MIN_SCALE pixels are drawn that large and
+    averaged down, otherwise their corners would not be rounded at all (a
+    2 pixel module is a plain square, a 3 pixel one a cross).
+    """
+    factor = math.ceil(ROUNDED_MIN_SCALE / scale)
+    size = scale * factor
+    stamp = Image.new('L', (size, size), 0)
+    ImageDraw.Draw(stamp).rounded_rectangle(
+        [0, 0, size - 1, size - 1], radius=size / 3, fill=255
+    )
+    coverage = np.asarray(stamp, dtype=np.float64).reshape(scale, factor, scale, factor).mean(axis=(1, 3))
+    return np.rint(coverage).astype(np.uint8)
+
+def _render_rounded(qr, scale, border):
+    """Render a QR code with rounded modules as an RGBA image
+    
+    A single rounded module is drawn once per scale and stamped onto every
+    dark module in one array operation. Dark pixels are black with the
+    module's coverage as alpha, the background is transparent.
+    """
+    modules = _module_mask(qr, 1, border).astype(np.uint8)
+    alpha = np.kron(modules, _rounded_stamp(scale))
+    dark = np.zeros(alpha.shape + (4,), dtype=np.uint8)
+    dark[:, :, 3] = alpha
+    return _paint(alpha > 0, dark, (255, 255, 255, 0))
+
+def create_styled_qr(data, output_file, size, error_level='m', style='standard',
+                     cache=render_cache):
     """Create a styled QR code with various visual options"""
+    _write_file(output_file, render_styled_qr(data, size, error_level, style, cache))
+    return output_file
+
+def render_styled_qr(data, size, error_level='m', style='standard', cache=render_cache):
+    """Render a styled QR code and return it as PNG bytes"""
+    scale = max(1, int(size / 25))
+    
+    # Reuse a previous rendering of the same code if we have one
+    key = None
+    if cache is not None:
+        key = cache.make_key(data, error_level, False, scale, 4, style)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    
+    png = _render_styled_qr(data, scale, error_level, style)
+    
+    if cache is not None:
+        cache.put(key, png)
+    
+    return png
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _png_bytes(img):
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def _render_styled_qr(data, scale, error_level, style):
+    """Render a styled QR code as PNG bytes"""
     # Generate the QR code
     qr = segno.make(data, error=error_level)
     
     if style == 'standard':
         # Standard QR code
-        scale = max(1, int(size / 25))
-        qr.save(output_file, scale=scale, border=4)
+        return matrix_to_png(qr.matrix, scale, border=4)
     
     elif style == 'rounded':
-        # Rounded QR code
-        scale = max(1, int(size / 25))
-        qr.save(output_file, scale=scale, border=4, 
-                dark='black', light='white', 
-                finder_dark='black', finder_light='white',
-                data_dark='black', data_light='white',
-                quiet_zone='white')
-        
-        # Open the image and apply rounded corners
-        img = Image.open(output_file)
-        
-        # Create a new image with rounded corners
-        rounded_img = Image.new("RGBA", img.size, (255, 255, 255, 0))
-        draw = ImageDraw.Draw(rounded_img)
-        
-        # Get module size
-        module_size = scale
-        
-        # Draw rounded rectangles for each black module
-        for y in range(qr.symbol_size()[0]):
-            for x in range(qr.symbol_size()[1]):
-                if qr.get_module(x, y):
-                    # Calculate position with border
-                    pos_x = (x + 4) * module_size
-                    pos_y = (y + 4) * module_size
-                    
-                    # Draw rounded rectangle
-                    draw.rounded_rectangle(
-                        [pos_x, pos_y, pos_x + module_size, pos_y + module_size],
-                        radius=module_size/3,
-                        fill="black"
-                    )
-        
-        # Save the rounded QR code
-        rounded_img.save(output_file)
+        # Rounded QR code on a transparent background
+        return _png_bytes(_render_rounded(qr, scale, border=4))
     
     elif style == 'gradient':
-        # Gradient QR code
-        scale = max(1, int(size / 25))
-        
-        # Generate a temporary standard QR
-        temp_file = output_file + ".temp.png"
-        qr.save(temp_file, scale=scale, border=4)
-        
-        # Open the image
-        img = Image.open(temp_file).convert("RGBA")
-        width, height = img.size
-        
-        # Create gradient image
-        gradient = Image.new("RGBA", img.size, (255, 255, 255, 0))
-        draw = ImageDraw.Draw(gradient)
-        
-        # Create a gradient from blue to purple
-        for y in range(height):
-            # Calculate color based on position
-            r = int(50 + (150 * y / height))
-            g = 0
-            b = int(200 - (50 * y / height))
-            
-            # Draw horizontal line with this color
-            draw.line([(0, y), (width, y)], fill=(r, g, b, 255))
-        
-        # Composite the QR code with the gradient
-        result = Image.new("RGBA", img.size, (255, 255, 255, 255))
-        
-        # For each pixel, if the QR code is black, use the gradient color
-        for x in range(width):
-            for y in range(height):
-                pixel = img.getpixel((x, y))
-                if pixel[0] < 128:  # If it's a dark pixel in the QR code
-                    result.putpixel((x, y), gradient.getpixel((x, y)))
-        
-        # Save the result
-        result.save(output_file)
-        
-        # Clean up temporary file
-        os.remove(temp_file)
+        # Gradient QR code: dark modules run from blue to purple, top to bottom
+        mask = _module_mask(qr, scale, border=4)
+        colors = _vertical_gradient(mask.shape[0], (50, 0, 200), (200, 0, 150))
+        return _png_bytes(_paint(mask, colors[:, None, :], (255, 255, 255, 255)))
     
     elif style == 'custom':
         # Custom colored QR code with logo placeholder
-        scale = max(1, int(size / 25))
-        qr.save(output_file, scale=scale, border=4, 
-                dark='#1a73e8', light='#f8f9fa')
+        return matrix_to_png(qr.matrix, scale, border=4, dark='#1a73e8', light='#f8f9fa')
     
-    return output_file
+    raise ValueError(f'Unknown QR code style: {style}')
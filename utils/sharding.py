@@ -0,0 +1,229 @@
+import os
+import json
+import math
+import time
+import socket
+import shutil
+import itertools
+import logging
+from utils.file_utils import iter_file_data
+from utils.qr_generator import merge_pdfs, merge_zips, qr_per_page, svg_sheet_header, SVG_SHEET_FOOTER, DEFAULT_PAGE_LAYOUT
+from utils.checkpoint import job_fingerprint
+from utils.pipeline import write_batches, count_codes, entry_names, CHECKPOINT_OPTIONS, SVG_SHEET
+
+logger = logging.getLogger(__name__)
+
+# Manifest describing the shards of a job, kept in the shared work directory
+MANIFEST_FILE = 'shards.json'
+
+def plan_shards(file_path, work_dir, options, shards):
+    """
+    Split a job into shards of consecutive rows and write its manifest
+
+    Shards cover whole PDF pages, so every shard knows its first page and
+    the document's page count, and the merged PDF matches a single-node
+    run. The split only depends on the row count and the number of shards.
+    work_dir must be reachable by every node running a shard.
+
+    Returns the path of the manifest.
+    """
+    total_rows, unique_rows = count_codes(iter_file_data(file_path, options.get('column_index', 0),
+                                                         options.get('max_rows')))
+    if not total_rows:
+        raise ValueError('No valid data found in the specified column')
+
+    per_page = qr_per_page(options['qr_size'], options.get('page_margin', 5), options.get('qr_margin', 0),
+                           options.get('page_layout', DEFAULT_PAGE_LAYOUT))
+    total_pages = math.ceil(total_rows / per_page)
+    pages_per_shard = math.ceil(total_pages / shards)
+
+    entries = []
+    for first_page in range(0, total_pages, pages_per_shard):
+        index = len(entries)
+        entries.append({
+            'index': index,
+            'start_row': first_page * per_page,
+            'end_row': min((first_page + pages_per_shard) * per_page, total_rows),
+            'first_page': first_page,
+            'pdf': f"part_{index:04d}.pdf",
+            'zip': f"part_{index:04d}.zip",
+            'svg': f"part_{index:04d}.svg",
+            'status': f"part_{index:04d}.json"
+        })
+
+    manifest = {
+        'file_path': os.path.abspath(file_path),
+        'fingerprint': job_fingerprint(file_path, options, CHECKPOINT_OPTIONS),
+        'options': options,
+        'total_rows': total_rows,
+        'unique_rows': unique_rows,
+        'qr_per_page': per_page,
+        'total_pages': total_pages,
+        'shards': entries
+    }
+
+    os.makedirs(work_dir, exist_ok=True)
+    manifest_path = os.path.join(work_dir, MANIFEST_FILE)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(f"Planned {len(entries)} shards of {pages_per_shard} pages for {total_rows} rows")
+    return manifest_path
+
+def load_manifest(manifest_path):
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def run_shard(manifest_path, index, workers=None, progress=None):
+    """
+    Generate the numbered part files of one shard
+
+    Can run on any node that sees the input file and the manifest's
+    directory. Running a shard again replaces its parts. Returns the
+    shard's status record, which is also written next to the manifest.
+    """
+    manifest = load_manifest(manifest_path)
+    work_dir = os.path.dirname(os.path.abspath(manifest_path))
+    shard = manifest['shards'][index]
+    options = dict(manifest['options'], workers=workers or manifest['options'].get('workers'))
+
+    if job_fingerprint(manifest['file_path'], options, CHECKPOINT_OPTIONS) != manifest['fingerprint']:
+        raise ValueError('Input file or options do not match the shard manifest')
+
+    pdf_path = os.path.join(work_dir, shard['pdf'])
+    zip_path = os.path.join(work_dir, shard['zip'])
+    # Shards write the elements of the SVG sheet, the merge adds its header
+    sheet_path = os.path.join(work_dir, shard['svg']) if options.get('svg_sheet') else None
+    parts_dir = os.path.join(work_dir, f"part_{index:04d}_pages")
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+    for path in (zip_path, sheet_path):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    started = time.time()
+    start = time.perf_counter()
+    timings = {}
+    data = iter_file_data(manifest['file_path'], options.get('column_index', 0), options.get('max_rows'))
+    # Values of earlier shards are named (and written) by those shards
+    names = entry_names(itertools.islice(data, shard['start_row']), options.get('image_format', 'png'))
+    data = itertools.islice(data, shard['end_row'] - shard['start_row'])
+
+    pdf_parts = []
+    zip_parts = []
+    rows_done = shard['start_row']
+    symbols = {'micro': 0, 'standard': 0}
+    for rows_done, batch_pdf_parts, zip_part in write_batches(data, parts_dir, parts_dir, shard['start_row'],
+                                                              manifest['total_pages'], options, sheet_path,
+                                                              progress, timings, symbols, names):
+        pdf_parts += batch_pdf_parts
+        if zip_part:
+            zip_parts.append(zip_part)
+
+    if rows_done != shard['end_row']:
+        raise ValueError(f"Shard {index} expected rows {shard['start_row']}-{shard['end_row']}, "
+                         f"the input ended at row {rows_done}")
+
+    if pdf_parts:
+        merge_pdfs(pdf_parts, pdf_path)
+    if zip_parts:
+        merge_zips(zip_parts, zip_path)
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+    status = {
+        'index': index,
+        'rows': shard['end_row'] - shard['start_row'],
+        'seconds': round(time.perf_counter() - start, 3),
+        'host': socket.gethostname(),
+        'started': started,
+        'finished': time.time(),
+        'timings': {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        'symbols': symbols
+    }
+    status_path = os.path.join(work_dir, shard['status'])
+    with open(status_path + '.tmp', 'w') as f:
+        json.dump(status, f)
+    os.replace(status_path + '.tmp', status_path)
+
+    logger.info(f"Shard {index} finished {status['rows']} rows in {status['seconds']}s")
+    return status
+
+def pending_shards(manifest_path):
+    """Return the indexes of the shards that have not finished yet"""
+    manifest = load_manifest(manifest_path)
+    work_dir = os.path.dirname(os.path.abspath(manifest_path))
+    return [shard['index'] for shard in manifest['shards']
+            if not os.path.exists(os.path.join(work_dir, shard['status']))]
+
+def merge_shards(manifest_path, pdf_path=None, zip_path=None, sheet_path=None):
+    """
+    Stitch the parts of every shard into the final PDF, ZIP and/or SVG sheet
+
+    Output paths default to the ones in the job options. Returns the same
+    stats and paths as a single-node run, with the stage timings summed
+    over all shards and the wall time of the whole job in 'seconds'.
+    """
+    manifest = load_manifest(manifest_path)
+    work_dir = os.path.dirname(os.path.abspath(manifest_path))
+    options = manifest['options']
+    download_type = options.get('download_type', 'pdf')
+
+    missing = pending_shards(manifest_path)
+    if missing:
+        raise ValueError(f"Shards not finished yet: {', '.join(str(index) for index in missing)}")
+
+    # Stage timings summed over all shards
+    timings = {}
+    statuses = []
+    for shard in manifest['shards']:
+        with open(os.path.join(work_dir, shard['status'])) as f:
+            statuses.append(json.load(f))
+        for stage, seconds in statuses[-1]['timings'].items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    result = {
+        'stats': {
+            'total_qr_codes': manifest['total_rows'],
+            'unique_qr_codes': manifest['unique_rows'],
+            'micro_qr_codes': sum(status['symbols']['micro'] for status in statuses),
+            'standard_qr_codes': sum(status['symbols']['standard'] for status in statuses)
+        },
+        'shards': len(manifest['shards'])
+    }
+    start = time.perf_counter()
+
+    if download_type in ['pdf', 'both']:
+        pdf_path = pdf_path or options.get('pdf_path') or os.path.join(work_dir, 'qr_codes.pdf')
+        merge_pdfs([os.path.join(work_dir, shard['pdf']) for shard in manifest['shards']], pdf_path)
+        result['pdf_path'] = pdf_path
+        result['stats'] = dict(qr_per_page=manifest['qr_per_page'],
+                               total_pages=manifest['total_pages'], **result['stats'])
+
+    if download_type in ['zip', 'both']:
+        zip_path = zip_path or options.get('zip_path') or os.path.join(work_dir, 'qr_codes.zip')
+        # Shards name their entries after the rows before them, so a value
+        # is only in the first shard holding it and names never clash
+        merge_zips([os.path.join(work_dir, shard['zip']) for shard in manifest['shards']], zip_path)
+        result['zip_path'] = zip_path
+
+    if options.get('svg_sheet'):
+        sheet_path = sheet_path or options.get('sheet_path') or os.path.join(work_dir, SVG_SHEET)
+        with open(sheet_path, 'w') as sheet:
+            sheet.write(svg_sheet_header(manifest['total_rows'], options['qr_size'],
+                                         options.get('page_margin', 5), options.get('qr_margin', 0),
+                                         options.get('include_text', False),
+                                         options.get('page_layout', DEFAULT_PAGE_LAYOUT)))
+            for shard in manifest['shards']:
+                with open(os.path.join(work_dir, shard['svg'])) as part:
+                    shutil.copyfileobj(part, sheet)
+            sheet.write(SVG_SHEET_FOOTER)
+        result['sheet_path'] = sheet_path
+
+    if options.get('image_dir'):
+        result['image_dir'] = options['image_dir']
+
+    timings['merge'] = time.perf_counter() - start
+    result['timings'] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    # Wall time from the first shard starting to the end of the merge
+    result['seconds'] = time.time() - min(status['started'] for status in statuses)
+    return result
@@ -0,0 +1,136 @@
+import io
+import logging
+import segno
+from PIL import Image
+from utils.qr_generator import render_styled_qr, matrix_to_png
+from utils.qr_cache import render_cache
+
+logger = logging.getLogger(__name__)
+
+# Kinds of single codes, with the file each one is downloaded as
+# (/download/<session_id>/<kind>_qr) and the message shown with it
+SINGLE_TYPES = {
+    'url': ('url_qr.png', 'URL QR code generated successfully'),
+    'vcard': ('vcard_qr.png', 'vCard QR code generated successfully'),
+    'image': ('image_qr.png', 'Image QR code generated successfully')
+}
+
+# File downloaded for each /download/<session_id>/<file_type> of a single code
+SINGLE_DOWNLOADS = {f'{kind}_qr': file_name for kind, (file_name, _) in SINGLE_TYPES.items()}
+
+def build_vcard(form_data):
+    """Build vCard 3.0 text from the contact fields of the form"""
+    name = form_data.get('name', '').strip()
+    email = form_data.get('email', '').strip()
+    phone = form_data.get('phone', '').strip()
+    company = form_data.get('company', '').strip()
+    title = form_data.get('title', '').strip()
+    website = form_data.get('website', '').strip()
+    address = form_data.get('address', '').strip()
+
+    if not (name or email or phone):
+        raise ValueError('At least name, email, or phone is required')
+
+    # Create vCard format
+    vcard = [
+        "BEGIN:VCARD",
+        "VERSION:3.0"
+    ]
+
+    if name:
+        vcard.append(f"FN:{name}")
+        # Split name into parts if possible
+        name_parts = name.split()
+        if len(name_parts) > 1:
+            vcard.append(f"N:{name_parts[-1]};{' '.join(name_parts[:-1])}")
+        else:
+            vcard.append(f"N:{name}")
+
+    if email:
+        vcard.append(f"EMAIL:{email}")
+
+    if phone:
+        vcard.append(f"TEL:{phone}")
+
+    if company:
+        vcard.append(f"ORG:{company}")
+
+    if title:
+        vcard.append(f"TITLE:{title}")
+
+    if website:
+        if not website.startswith(('http://', 'https://')):
+            website = 'https://' + website
+        vcard.append(f"URL:{website}")
+
+    if address:
+        vcard.append(f"ADR:;;{address}")
+
+    vcard.append("END:VCARD")
+    return "\n".join(vcard)
+
+def render_single_qr(generation_type, form_data, image=None):
+    """
+    Render the code of a URL, vCard or image request as PNG bytes
+
+    form_data is a plain dict of the form fields and image the bytes of
+    the uploaded picture for image codes. Only takes and returns plain
+    data, so it can run in a worker process. Invalid input raises
+    ValueError with a message for the user.
+    """
+    qr_size = int(form_data.get('qr_size', 300))
+
+    if generation_type == 'url':
+        url = form_data.get('url', '').strip()
+        if not url:
+            raise ValueError('URL is required')
+
+        # Validate URL format
+        if not url.startswith(('http://', 'https://')):
+            url = 'https://' + url
+
+        return render_styled_qr(url, qr_size, form_data.get('error_level', 'm'),
+                                form_data.get('qr_style', 'standard'))
+
+    if generation_type == 'vcard':
+        qr = segno.make(build_vcard(form_data), error=form_data.get('error_level', 'm'))
+        return matrix_to_png(qr.matrix, max(1, int(qr_size / 25)), border=4)
+
+    if generation_type == 'image':
+        qr_data = form_data.get('qr_data', '').strip()
+        if not qr_data:
+            raise ValueError('QR code data is required')
+
+        # Use high error correction for image QR
+        qr = segno.make(qr_data, error=form_data.get('error_level', 'h'))
+
+        # Open and resize the image
+        img = Image.open(io.BytesIO(image))
+        img = img.resize((qr_size // 3, qr_size // 3))
+
+        # Create a new image with the QR code
+        scale = max(1, int(qr_size / 25))
+        qr_img = Image.open(io.BytesIO(matrix_to_png(qr.matrix, scale, border=4))).convert('RGB')
+
+        # Paste the image onto the QR code, in the center
+        position = ((qr_img.width - img.width) // 2, (qr_img.height - img.height) // 2)
+        qr_img.paste(img, position)
+
+        buffer = io.BytesIO()
+        qr_img.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    raise ValueError('Invalid generation type')
+
+def render_single_qr_counted(generation_type, form_data, image=None):
+    """
+    Render like render_single_qr, returning (png, render cache counters)
+
+    The counters are what the render added to the hit/miss counters of
+    this process's render_cache. A worker process returns them so the
+    server process can add them to its own (QRRenderCache.add_counters).
+    """
+    before = render_cache.stats()
+    png = render_single_qr(generation_type, form_data, image)
+    after = render_cache.stats()
+    return png, {name: after[name] - before[name] for name in render_cache.counters}